@@ -0,0 +1,209 @@
+from django.core.exceptions import ObjectDoesNotExist
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def serialize_user(user):
+    return {
+        'id': user.pk,
+        'username': user.username,
+        'name': user.get_full_name(),
+    }
+
+
+def serialize_group(group):
+    return {'id': group.pk, 'slug': group.slug, 'title': group.title}
+
+
+class Resource:
+    """Поля ответа API и столбцы базы, которые для них нужны.
+
+    fields= выбирает поля ответа, а через .only() — и читаемые столбцы;
+    embed= вместо id связанного объекта вкладывает сам объект, выбранный
+    тем же запросом через select_related.
+    """
+    fields = {}
+    embeds = {}
+    required = ('pk',)
+
+    def __init__(self, params):
+        self.embed = self.parse(params.get('embed'), self.embeds, 'embed')
+        self.names = self.parse(
+            params.get('fields'), self.fields, 'fields'
+        ) or list(self.fields)
+        self.names += [name for name in self.embed if name not in self.names]
+
+    @staticmethod
+    def parse(value, allowed, param):
+        names = list(dict.fromkeys(
+            name.strip() for name in (value or '').split(',') if name.strip()
+        ))
+        unknown = [name for name in names if name not in allowed]
+        if unknown:
+            raise ApiError(f'{param}: неизвестные поля {", ".join(unknown)}')
+        return names
+
+    def columns(self):
+        columns = set(self.required)
+        for name in self.names:
+            columns.update(self.fields[name])
+        for name in self.embed:
+            columns.update(
+                f'{name}__{column}' for column in self.embeds[name][0]
+            )
+        return columns
+
+    def queryset(self, query):
+        columns = self.columns()
+        related = {
+            column.split('__')[0] for column in columns if '__' in column
+        }
+        return query.select_related(*related).only(*columns)
+
+    def serialize(self, obj):
+        data = {}
+        for name in self.names:
+            if name in self.embed:
+                related = getattr(obj, name)
+                data[name] = related and self.embeds[name][1](related)
+            else:
+                data[name] = getattr(self, f'get_{name}')(obj)
+        return data
+
+
+class PostResource(Resource):
+    fields = {
+        'id': (),
+        'text': ('text',),
+        'pub_date': ('pub_date',),
+        'author': ('author',),
+        'group': ('group',),
+        'image': (
+            'image', 'image_width', 'image_height',
+            'image_color', 'image_placeholder',
+        ),
+        'comment_count': ('comment_count',),
+    }
+    embeds = {
+        'author': (('username', 'first_name', 'last_name'), serialize_user),
+        'group': (('slug', 'title'), serialize_group),
+    }
+    required = ('pk', 'pub_date')
+
+    def get_id(self, post):
+        return post.pk
+
+    def get_text(self, post):
+        return post.text
+
+    def get_pub_date(self, post):
+        return post.pub_date.isoformat()
+
+    def get_author(self, post):
+        return post.author_id
+
+    def get_group(self, post):
+        return post.group_id
+
+    def get_image(self, post):
+        if not post.image:
+            return None
+        return {
+            'url': post.image.url,
+            'width': post.image_width,
+            'height': post.image_height,
+            'color': post.image_color,
+            'placeholder': post.image_placeholder,
+        }
+
+    def get_comment_count(self, post):
+        return post.comment_count
+
+
+class CommentResource(Resource):
+    fields = {
+        'id': (),
+        'post': ('post',),
+        'author': ('author',),
+        'text': ('text',),
+        'created': ('created',),
+    }
+    embeds = {
+        'author': (('username', 'first_name', 'last_name'), serialize_user),
+    }
+    required = ('pk', 'created')
+
+    def get_id(self, comment):
+        return comment.pk
+
+    def get_post(self, comment):
+        return comment.post_id
+
+    def get_author(self, comment):
+        return comment.author_id
+
+    def get_text(self, comment):
+        return comment.text
+
+    def get_created(self, comment):
+        return comment.created.isoformat()
+
+
+class GroupResource(Resource):
+    fields = {
+        'id': (),
+        'slug': ('slug',),
+        'title': ('title',),
+        'description': ('description',),
+    }
+
+    def get_id(self, group):
+        return group.pk
+
+    def get_slug(self, group):
+        return group.slug
+
+    def get_title(self, group):
+        return group.title
+
+    def get_description(self, group):
+        return group.description
+
+
+class ProfileResource(Resource):
+    fields = {
+        'id': (),
+        'username': ('username',),
+        'name': ('first_name', 'last_name'),
+        'posts_count': ('counters__posts_count',),
+        'followers_count': ('counters__followers_count',),
+        'following_count': ('counters__following_count',),
+    }
+
+    def counter(self, user, name):
+        try:
+            return getattr(user.counters, name)
+        except ObjectDoesNotExist:
+            return 0
+
+    def get_id(self, user):
+        return user.pk
+
+    def get_username(self, user):
+        return user.username
+
+    def get_name(self, user):
+        return user.get_full_name()
+
+    def get_posts_count(self, user):
+        return self.counter(user, 'posts_count')
+
+    def get_followers_count(self, user):
+        return self.counter(user, 'followers_count')
+
+    def get_following_count(self, user):
+        return self.counter(user, 'following_count')
@@ -0,0 +1,201 @@
+from http import HTTPStatus
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from api.urls import urlpatterns
+from core.caching import get_versions
+from core.querybudget import QueryRecorder
+from core.testing import QueryBudgetTestMixin
+from posts.models import Comment, Follow, Group, Post
+
+
+User = get_user_model()
+
+
+class ApiTest(QueryBudgetTestMixin, TestCase):
+    COUNT_POSTS = 25
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{i}', first_name='Автор', last_name=str(i)
+            )
+            for i in range(3)
+        ]
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        cls.posts = [
+            Post.objects.create(
+                text=f'Пост номер {i}',
+                author=cls.authors[i % 3],
+                group=cls.group if i % 2 else None,
+            )
+            for i in range(cls.COUNT_POSTS)
+        ]
+        cls.post = cls.posts[-1]
+        for i in range(5):
+            Comment.objects.create(
+                post=cls.post, author=cls.authors[i % 3],
+                text=f'Комментарий {i}'
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def url_kwargs(self):
+        return {
+            'post_detail': {'post_id': self.post.pk},
+            'post_comments': {'post_id': self.post.pk},
+            'group_detail': {'slug': self.group.slug},
+            'group_posts': {'slug': self.group.slug},
+            'profile_detail': {'username': self.authors[0].username},
+            'profile_posts': {'username': self.authors[0].username},
+        }
+
+    def test_endpoints_stay_within_budget_and_use_indexes(self):
+        kwargs = self.url_kwargs()
+        for pattern in urlpatterns:
+            url = reverse(
+                f'api:{pattern.name}', kwargs=kwargs.get(pattern.name)
+            )
+            with self.subTest(url=url):
+                response = self.assertWithinQueryBudget(self.client, url)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertQueriesUseIndexes(
+                    self.client, url, allow_scans=('posts_group',)
+                )
+
+    def test_cursor_pagination_walks_all_posts(self):
+        url = reverse('api:post_list')
+        seen = []
+        params = {'limit': 10, 'fields': 'id'}
+        while True:
+            data = self.client.get(url, params).json()
+            seen += [post['id'] for post in data['results']]
+            if not data['next']:
+                break
+            params['after'] = data['next']
+        self.assertEqual(
+            seen, [post.pk for post in reversed(self.posts)]
+        )
+        previous = self.client.get(url, params).json()['previous']
+        data = self.client.get(
+            url, {'limit': 10, 'fields': 'id', 'before': previous}
+        ).json()
+        self.assertEqual(
+            [post['id'] for post in data['results']], seen[10:20]
+        )
+
+    def test_sparse_fields_select_only_needed_columns(self):
+        with QueryRecorder() as recorder:
+            data = self.client.get(
+                reverse('api:post_list'), {'fields': 'id,text'}
+            ).json()
+        self.assertEqual(set(data['results'][0]), {'id', 'text'})
+        sql = recorder.queries[-1][0]
+        self.assertIn('"text"', sql)
+        self.assertNotIn('"image"', sql)
+
+    def test_embed_avoids_n_plus_one(self):
+        with QueryRecorder() as recorder:
+            data = self.client.get(
+                reverse('api:post_list'),
+                {'embed': 'author,group', 'fields': 'id'}
+            ).json()
+        self.assertEqual(len(recorder), 1)
+        post = data['results'][1]
+        self.assertEqual(set(post), {'id', 'author', 'group'})
+        self.assertEqual(post['group']['slug'], self.group.slug)
+        self.assertEqual(post['author']['name'], 'Автор 2')
+        self.assertIsNone(data['results'][0]['group'])
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get(
+            reverse('api:post_list'), {'fields': 'id,password'}
+        )
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertIn('password', response.json()['error'])
+
+    def test_missing_object_is_json_404(self):
+        response = self.client.get(
+            reverse('api:profile_detail', args=('nobody',))
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        self.assertIn('error', response.json())
+
+    def test_etag_changes_with_data(self):
+        url = reverse('api:post_detail', args=(self.post.pk,))
+        etag = self.client.get(url)['ETag']
+        with QueryRecorder() as recorder:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        self.assertEqual(len(recorder), 0)
+        Comment.objects.create(
+            post=self.post, author=self.authors[0], text='Новый'
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.json()['comment_count'], 6)
+
+    def test_post_list_etag_changes_with_comments(self):
+        """В списке постов есть comment_count: новый комментарий
+        меняет ETag списков API, где виден пост."""
+        post = self.posts[-2]
+        urls = (
+            reverse('api:post_list'),
+            reverse('api:group_posts', args=(post.group.slug,)),
+            reverse('api:profile_posts', args=(post.author.username,)),
+        )
+        etags = {url: self.client.get(url)['ETag'] for url in urls}
+        for url, etag in etags.items():
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        html_versions = get_versions(
+            'posts', f'author:{post.author.username}',
+            f'group:{post.group.slug}'
+        )
+        comment = Comment.objects.create(
+            post=post, author=self.authors[0], text='Новый'
+        )
+        self.assertEqual(
+            get_versions(*html_versions), html_versions,
+            'HTML-страницы и ленты не сбрасываются из-за комментария'
+        )
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                etags[url] = response['ETag']
+        comment.delete()
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_profile_etag_changes_with_following(self):
+        """following_count подписчика меняется вместе с ETag профиля."""
+        follower, author = self.authors[1], self.authors[0]
+        url = reverse('api:profile_detail', args=(follower.username,))
+        etag = self.client.get(url)['ETag']
+        follow = Follow.objects.create(user=follower, author=author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.json()['following_count'], 1)
+        etag = response['ETag']
+        follow.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.json()['following_count'], 0)
+
+    def test_profile_counters(self):
+        data = self.client.get(
+            reverse('api:profile_detail', args=('author0',))
+        ).json()
+        self.assertEqual(data['username'], 'author0')
+        self.assertEqual(data['posts_count'], 9)
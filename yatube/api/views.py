@@ -0,0 +1,130 @@
+from functools import wraps
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.http import condition, require_safe
+
+from api.resources import (
+    ApiError, CommentResource, GroupResource, PostResource, ProfileResource
+)
+from core.caching import versions_etag
+from core.querybudget import query_budget
+from posts.models import Group, Post, User
+from posts.paginators import KeysetPaginator
+from posts.scopes import post_scopes
+
+
+def api_view(scopes):
+    def decorator(view_func):
+        @require_safe
+        @condition(etag_func=versions_etag(scopes))
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            try:
+                return view_func(request, *args, **kwargs)
+            except ApiError as error:
+                return JsonResponse(
+                    {'error': str(error)}, status=error.status
+                )
+        return wrapper
+    return decorator
+
+
+def get_object(query, **kwargs):
+    obj = query.filter(**kwargs).first()
+    if obj is None:
+        raise ApiError('Не найдено', status=404)
+    return obj
+
+
+def page_size(params):
+    try:
+        limit = int(params.get('limit', settings.API_PAGE_SIZE))
+    except ValueError:
+        raise ApiError('limit: нужно целое число')
+    return max(1, min(limit, settings.API_MAX_PAGE_SIZE))
+
+
+def cursor_page(request, query, resource, date_field='pub_date'):
+    """Страница списка по курсорам after/before (posts.paginators)."""
+    page = KeysetPaginator(
+        resource.queryset(query), page_size(request.GET), date_field
+    ).get_page(
+        after=request.GET.get('after'), before=request.GET.get('before')
+    )
+    return JsonResponse({
+        'results': [resource.serialize(obj) for obj in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+# Списки постов отдают comment_count, поэтому зависят и от области
+# 'comments': её сдвигает каждый комментарий, не трогая HTML и ленты.
+@query_budget(1)
+@api_view(lambda: ['posts', 'comments'])
+def post_list(request):
+    return cursor_page(request, Post.objects.all(), PostResource(request.GET))
+
+
+@query_budget(2)
+@api_view(post_scopes)
+def post_detail(request, post_id):
+    resource = PostResource(request.GET)
+    post = get_object(resource.queryset(Post.objects.all()), pk=post_id)
+    return JsonResponse(resource.serialize(post))
+
+
+@query_budget(2)
+@api_view(lambda post_id: [f'post:{post_id}', 'posts'])
+def post_comments(request, post_id):
+    post = get_object(Post.objects.only('pk'), pk=post_id)
+    return cursor_page(
+        request, post.comments.all(), CommentResource(request.GET),
+        date_field='created'
+    )
+
+
+@query_budget(1)
+@api_view(lambda: ['posts'])
+def group_list(request):
+    """Все группы сразу: это небольшой справочник."""
+    resource = GroupResource(request.GET)
+    groups = resource.queryset(Group.objects.order_by('slug'))
+    return JsonResponse({
+        'results': [resource.serialize(group) for group in groups],
+    })
+
+
+@query_budget(1)
+@api_view(lambda slug: [f'group:{slug}'])
+def group_detail(request, slug):
+    resource = GroupResource(request.GET)
+    group = get_object(resource.queryset(Group.objects.all()), slug=slug)
+    return JsonResponse(resource.serialize(group))
+
+
+@query_budget(2)
+@api_view(lambda slug: [f'group:{slug}', 'comments'])
+def group_posts(request, slug):
+    group = get_object(Group.objects.only('pk'), slug=slug)
+    return cursor_page(request, group.posts.all(), PostResource(request.GET))
+
+
+@query_budget(1)
+@api_view(lambda username: [f'author:{username}'])
+def profile_detail(request, username):
+    resource = ProfileResource(request.GET)
+    author = get_object(
+        resource.queryset(User.objects.all()), username=username
+    )
+    return JsonResponse(resource.serialize(author))
+
+
+@query_budget(2)
+@api_view(lambda username: [f'author:{username}', 'comments'])
+def profile_posts(request, username):
+    author = get_object(User.objects.only('pk'), username=username)
+    return cursor_page(
+        request, author.posts.all(), PostResource(request.GET)
+    )
@@ -0,0 +1,134 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from core.holes import fill_holes
+
+
+VERSION_KEY: str = 'version:{}'
+SHELL_KEY: str = 'shell:{}:{}:{}'
+
+
+def version_key(scope):
+    return VERSION_KEY.format(hashlib.md5(scope.encode()).hexdigest())
+
+
+def get_versions(*scopes):
+    """Возвращает версии областей кэша; отсутствующие заводит заново.
+
+    Версия — время последнего изменения области (timestamp), так что
+    после вытеснения из кэша новая версия не совпадёт со старой.
+    """
+    keys = {scope: version_key(scope) for scope in scopes}
+    cached = cache.get_many(keys.values())
+    versions = {}
+    missing = {}
+    for scope, key in keys.items():
+        if key not in cached:
+            missing[key] = time.time()
+        versions[scope] = cached.get(key, missing.get(key))
+    if missing:
+        cache.set_many(missing, None)
+    return versions
+
+
+def bump(*scopes):
+    now = time.time()
+    cache.set_many(
+        {version_key(scope): now for scope in scopes}, None
+    )
+
+
+def versions_digest(versions):
+    raw = '|'.join(
+        f'{scope}={versions[scope]!r}' for scope in sorted(versions)
+    )
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def versions_etag(scopes, vary_user=False):
+    """etag_func для django.views.decorators.http.condition: версии
+    областей scopes(**kwargs) и адрес запроса. Считается по кэшу, так что
+    совпавший If-None-Match даёт 304 без запросов к базе.
+
+    vary_user добавляет пользователя — для страниц с личными фрагментами.
+    """
+    def etag(request, *args, **kwargs):
+        versions = get_versions(*scopes(*args, **kwargs))
+        versions['url'] = request.get_full_path()
+        if vary_user:
+            versions['user'] = request.user.pk
+        return versions_digest(versions)
+    return etag
+
+
+def versions_last_modified(scopes):
+    """last_modified_func для condition: время последнего bump областей."""
+    def last_modified(request, *args, **kwargs):
+        versions = get_versions(*scopes(*args, **kwargs))
+        return datetime.fromtimestamp(max(versions.values()), timezone.utc)
+    return last_modified
+
+
+def conditional_page(scopes):
+    """ETag и Last-Modified страницы по версиям её областей кэша.
+
+    Проверка идёт до view: повторный запрос неизменившейся страницы
+    получает 304 по одному обращению к кэшу. Cache-Control: no-cache
+    заставляет браузер переспрашивать страницу каждый раз, а не показывать
+    её копию по эвристике Last-Modified.
+    """
+    def decorator(view_func):
+        view_func = condition(
+            etag_func=versions_etag(scopes, vary_user=True),
+            last_modified_func=versions_last_modified(scopes)
+        )(view_func)
+        return cache_control(private=True, no_cache=True)(view_func)
+    return decorator
+
+
+def shell_cache_page(timeout, key_prefix, scopes):
+    """Кэширует общий для всех посетителей «каркас» страницы.
+
+    View рендерится с request.render_shell = True: тег {% hole %} вместо
+    персональных фрагментов (шапка, кнопки подписки, форма комментария)
+    оставляет метки. Каркас хранится под версионированным ключом, а
+    метки заполняются для текущего пользователя при каждом ответе.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+            versions = get_versions(*scopes(*args, **kwargs))
+            key = SHELL_KEY.format(
+                key_prefix,
+                versions_digest(versions),
+                hashlib.md5(request.get_full_path().encode()).hexdigest()
+            )
+            shell = cache.get(key)
+            if shell is None:
+                request.render_shell = True
+                try:
+                    response = view_func(request, *args, **kwargs)
+                finally:
+                    request.render_shell = False
+                if response.status_code != 200 or response.streaming:
+                    return response
+                shell = (
+                    response.content.decode(response.charset),
+                    response['Content-Type'],
+                )
+                cache.set(key, shell, timeout)
+            content, content_type = shell
+            return HttpResponse(
+                fill_holes(content, request), content_type=content_type
+            )
+        return wrapper
+    return decorator
@@ -0,0 +1,48 @@
+import re
+from urllib.parse import quote, unquote
+
+from django.template.loader import render_to_string
+
+
+HOLES = {}
+HOLE_MARKER: str = '<!--hole:{}:{}-->'
+HOLE_RE = re.compile(r'<!--hole:([\w-]+):([^>]*)-->')
+
+
+def register(name, template_name):
+    """Регистрирует персональный фрагмент страницы («дырку»).
+
+    Декорируемая функция получает request и аргументы тега и возвращает
+    контекст шаблона фрагмента.
+    """
+    def decorator(context_func):
+        HOLES[name] = (template_name, context_func)
+        return context_func
+    return decorator
+
+
+def render_hole(name, request, *args):
+    template_name, context_func = HOLES[name]
+    return render_to_string(
+        template_name, context_func(request, *args), request=request
+    )
+
+
+def hole_marker(name, *args):
+    return HOLE_MARKER.format(
+        name, '/'.join(quote(str(arg), safe='') for arg in args)
+    )
+
+
+def fill_holes(content, request):
+    """Подставляет в общий анонимный «каркас» фрагменты для request."""
+    def replace(match):
+        name, args = match.groups()
+        args = [unquote(arg) for arg in args.split('/')] if args else []
+        return render_hole(name, request, *args)
+    return HOLE_RE.sub(replace, content)
+
+
+@register('header', 'includes/header.html')
+def header(request):
+    return {}
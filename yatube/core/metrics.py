@@ -0,0 +1,29 @@
+import threading
+from collections import Counter
+
+
+_counters = Counter()
+_lock = threading.Lock()
+
+
+def incr(name, value=1):
+    """Увеличивает счётчик метрики процесса (попадания в кэш и т.п.)."""
+    with _lock:
+        _counters[name] += value
+
+
+def get(name):
+    return _counters[name]
+
+
+def snapshot(prefix=''):
+    with _lock:
+        return {
+            name: value for name, value in _counters.items()
+            if name.startswith(prefix)
+        }
+
+
+def reset():
+    with _lock:
+        _counters.clear()
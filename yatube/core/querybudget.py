@@ -0,0 +1,100 @@
+import logging
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+
+
+logger = logging.getLogger(__name__)
+
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(max_queries):
+    """Объявляет максимальное число SQL-запросов на один вызов view.
+
+    Ставится самым внешним декоратором, чтобы атрибут оказался на
+    функции, которую видит URL-резолвер.
+    """
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+def query_shape(sql):
+    """SQL без параметров: запросы одной формы отличаются только ими."""
+    return IN_LIST_RE.sub('IN (...)', sql)
+
+
+class QueryRecorder:
+    """Записывает SQL, выполненный внутри with-блока, и ищет N+1."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+
+    def __len__(self):
+        return len(self.queries)
+
+    def repeated(self, threshold=None):
+        """Формы запросов, повторённые не меньше threshold раз."""
+        threshold = threshold or settings.QUERY_BUDGET_N_PLUS_ONE
+        shapes = Counter(query_shape(sql) for sql, _ in self.queries)
+        return {
+            shape: count for shape, count in shapes.items()
+            if count >= threshold
+        }
+
+
+def check_budget(view_name, budget, recorder):
+    """Возвращает описания нарушений бюджета и повторов для view."""
+    problems = []
+    if budget is not None and len(recorder) > budget:
+        problems.append(
+            f'{view_name}: {len(recorder)} запросов при бюджете {budget}'
+        )
+    for shape, count in recorder.repeated().items():
+        problems.append(f'{view_name}: N+1, {count} раз: {shape}')
+    return problems
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_BUDGET_ENABLED:
+            return self.get_response(request)
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        match = request.resolver_match
+        if match is None:
+            return response
+        response['X-Query-Count'] = len(recorder)
+        problems = check_budget(
+            match.view_name,
+            getattr(match.func, 'query_budget', None),
+            recorder
+        )
+        for problem in problems:
+            logger.warning(problem)
+        if problems and settings.QUERY_BUDGET_RAISE:
+            raise QueryBudgetExceeded('; '.join(problems))
+        return response
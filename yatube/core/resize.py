@@ -0,0 +1,152 @@
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare, salted_hmac
+from PIL import Image, ImageOps
+
+from core import metrics
+from core.thumbnails import single_flight
+
+
+CACHE_DIR: str = 'r'
+SIGNATURE_SALT: str = 'core.resize'
+SIGNATURE_LENGTH: int = 16
+FORMATS = ('JPEG', 'PNG', 'WEBP', 'GIF')
+
+_cache_sizes = {}
+_lock = threading.Lock()
+
+
+def sign(path, width, height):
+    value = f'{width}x{height}/{path}'
+    return salted_hmac(
+        SIGNATURE_SALT, value
+    ).hexdigest()[:SIGNATURE_LENGTH]
+
+
+def is_valid(signature, path, width, height):
+    return constant_time_compare(signature, sign(path, width, height))
+
+
+def resized_url(path, width, height):
+    """Подписанный адрес картинки path, уменьшенной до width x height.
+
+    Высота 0 сохраняет пропорции.
+    """
+    return reverse('resize_image', kwargs={
+        'signature': sign(path, width, height),
+        'width': width,
+        'height': height,
+        'path': path,
+    })
+
+
+def cache_root():
+    return os.path.join(settings.MEDIA_ROOT, CACHE_DIR)
+
+
+def cache_path(signature, path, width, height):
+    return os.path.join(cache_root(), signature, f'{width}x{height}', path)
+
+
+def resize(source_path, target_path, width, height):
+    """Уменьшает картинку и атомарно записывает результат в target_path."""
+    with Image.open(source_path) as image:
+        image_format = image.format if image.format in FORMATS else 'PNG'
+        image = ImageOps.exif_transpose(image)
+        if height:
+            image = ImageOps.fit(image, (width, height), Image.LANCZOS)
+        else:
+            image.thumbnail((width, image.height), Image.LANCZOS)
+        if image_format == 'JPEG':
+            image = image.convert('RGB')
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(target_path)
+        )
+        try:
+            with os.fdopen(handle, 'wb') as output:
+                image.save(
+                    output, image_format, quality=settings.RESIZE_QUALITY
+                )
+            os.replace(temp_path, target_path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+    track_size(os.path.getsize(target_path))
+
+
+def content_type(path):
+    """MIME-тип картинки по формату, в котором она записана: копия
+    в неподдерживаемом формате (BMP, TIFF) сохраняется как PNG."""
+    with Image.open(path) as image:
+        return Image.MIME.get(image.format)
+
+
+def cached_resize(source_path, target_path, width, height):
+    """Путь к уменьшенной копии; копия создаётся один раз на все процессы
+    и пересоздаётся, если исходная картинка новее."""
+    source_mtime = os.path.getmtime(source_path)
+    if is_fresh(target_path, source_mtime):
+        try:
+            os.utime(target_path)
+        except OSError:
+            pass
+        else:
+            metrics.incr('resize.hit')
+            return target_path
+    with single_flight(target_path) as leader:
+        if leader and not is_fresh(target_path, source_mtime):
+            metrics.incr('resize.miss')
+            resize(source_path, target_path, width, height)
+    return target_path
+
+
+def is_fresh(target_path, source_mtime):
+    try:
+        return os.path.getmtime(target_path) >= source_mtime
+    except OSError:
+        return False
+
+
+def scan():
+    """Файлы кэша как (время последнего запроса, размер, путь)."""
+    files = []
+    for directory, _, names in os.walk(cache_root()):
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+    return files
+
+
+def track_size(added):
+    """Учитывает новый файл и вытесняет давно не запрошенные копии,
+    когда кэш больше RESIZE_CACHE_MAX_SIZE байт."""
+    root = cache_root()
+    with _lock:
+        if root not in _cache_sizes:
+            _cache_sizes[root] = sum(size for _, size, _ in scan())
+        else:
+            _cache_sizes[root] += added
+        if _cache_sizes[root] <= settings.RESIZE_CACHE_MAX_SIZE:
+            return
+        files = sorted(scan())
+        total = sum(size for _, size, _ in files)
+        target = settings.RESIZE_CACHE_MAX_SIZE * 0.9
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            metrics.incr('resize.evicted')
+        _cache_sizes[root] = total
@@ -0,0 +1,16 @@
+from django import template
+
+from core.resize import resized_url
+
+
+register = template.Library()
+
+
+@register.filter
+def resized(image, size):
+    """{{ post.image|resized:'640x226' }} — подписанный адрес уменьшенной
+    копии картинки; высота 0 сохраняет пропорции."""
+    if not image:
+        return ''
+    width, height = (int(value) for value in size.split('x'))
+    return resized_url(image.name, width, height)
@@ -0,0 +1,56 @@
+import re
+
+from django.db import connection
+
+from core.querybudget import QueryRecorder, check_budget
+
+
+FULL_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\w+)$')
+
+
+class QueryBudgetTestMixin:
+    """Проверки бюджета запросов для тестов на django.test.TestCase."""
+
+    def assertWithinQueryBudget(self, client, url, data=None):
+        """GET url (или POST с data) укладывается в query_budget view."""
+        with QueryRecorder() as recorder:
+            if data is None:
+                response = client.get(url)
+            else:
+                response = client.post(url, data)
+        match = response.resolver_match
+        budget = getattr(match.func, 'query_budget', None)
+        self.assertIsNotNone(
+            budget, f'{match.view_name}: не объявлен query_budget'
+        )
+        problems = check_budget(match.view_name, budget, recorder)
+        self.assertFalse(problems, '\n'.join(problems))
+        return response
+
+    def assertQueriesUseIndexes(self, client, url, table_prefix='posts_',
+                                allow_scans=()):
+        """Проверяет по EXPLAIN QUERY PLAN (SQLite), что SELECT к таблицам
+        table_prefix не сканируют таблицу целиком и не сортируют вручную.
+
+        allow_scans — таблицы-справочники, которые читаются целиком.
+        """
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN проверяется только на SQLite')
+        with QueryRecorder() as recorder:
+            client.get(url)
+        problems = []
+        with connection.cursor() as cursor:
+            for sql, params in recorder.queries:
+                if not sql.startswith('SELECT') or table_prefix not in sql:
+                    continue
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                for *_, detail in cursor.fetchall():
+                    scan = FULL_SCAN_RE.match(detail)
+                    if scan and scan.group(1) in allow_scans:
+                        continue
+                    if (
+                        scan and scan.group(1).startswith(table_prefix)
+                        or 'TEMP B-TREE' in detail
+                    ):
+                        problems.append(f'{detail}: {sql}')
+        self.assertFalse(problems, '\n'.join(problems))
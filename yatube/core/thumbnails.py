@@ -0,0 +1,412 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, close_old_connections, transaction
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE, KVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core import metrics
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY: str = 'thumbnails:lock:{}'
+LOCK_POLL: float = 0.05
+
+_executor = None
+_pending = set()
+_flights = {}
+_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails'
+            )
+        return _executor
+
+
+def lock_key(key):
+    return LOCK_KEY.format(hashlib.md5(key.encode()).hexdigest())
+
+
+def lock_path(key):
+    return os.path.join(
+        settings.THUMBNAIL_LOCK_DIR,
+        hashlib.md5(key.encode()).hexdigest() + '.lock'
+    )
+
+
+def _add_shared_lock(key, deadline):
+    while not cache.add(key, True, settings.THUMBNAIL_LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(LOCK_POLL)
+    return True
+
+
+def _lock_file(path, deadline):
+    """Открытый файл path под flock или None, если не дождались.
+
+    Владелец удаляет файл перед снятием блокировки, поэтому после
+    захвата проверяется, что заблокирован файл, который ещё лежит
+    по этому пути, а не удалённый.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    while True:
+        lock_file = open(path, 'ab')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(LOCK_POLL)
+            continue
+        try:
+            current = os.stat(path)
+        except FileNotFoundError:
+            current = None
+        if current and current.st_ino == os.fstat(lock_file.fileno()).st_ino:
+            return lock_file
+        lock_file.close()
+
+
+def _unlock_file(path, lock_file):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    lock_file.close()
+
+
+@contextmanager
+def _shared_lock(key, deadline):
+    """Блокировка key между процессами: flock на файле в
+    THUMBNAIL_LOCK_DIR, а где flock нет — cache.add в кэше
+    (с LocMemCache — только внутри процесса)."""
+    if fcntl is None:
+        acquired = _add_shared_lock(lock_key(key), deadline)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                cache.delete(lock_key(key))
+        return
+    path = lock_path(key)
+    lock_file = _lock_file(path, deadline)
+    try:
+        yield lock_file is not None
+    finally:
+        if lock_file is not None:
+            _unlock_file(path, lock_file)
+
+
+@contextmanager
+def single_flight(key):
+    """Пускает к работе над key только один поток во всех процессах.
+
+    Внутри процесса очередь держит threading.Lock, между процессами —
+    flock (см. _shared_lock); блокировку упавшего процесса снимает ядро.
+    Ждёт не дольше THUMBNAIL_LOCK_WAIT секунд; отдаёт True, если работу
+    делает вызывающий, и False, если её уже делает кто-то другой.
+    """
+    with _lock:
+        flight = _flights.setdefault(key, [threading.Lock(), 0])
+        flight[1] += 1
+    deadline = time.monotonic() + settings.THUMBNAIL_LOCK_WAIT
+    local = flight[0].acquire(timeout=settings.THUMBNAIL_LOCK_WAIT)
+    try:
+        if not local:
+            yield False
+        else:
+            with _shared_lock(key, deadline) as shared:
+                yield shared
+    finally:
+        if local:
+            flight[0].release()
+        with _lock:
+            flight[1] -= 1
+            if not flight[1]:
+                del _flights[key]
+
+
+def generate(name, geometries, done=None):
+    """Создаёт миниатюры картинки для пар (геометрия, опции) сразу,
+    затем вызывает done."""
+    for geometry, options in geometries:
+        default.backend.render_thumbnail(name, geometry, options)
+    if done is not None:
+        done()
+
+
+def _run(key, func, args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Фоновая обработка картинки %s не удалась', key)
+    finally:
+        with _lock:
+            _pending.discard(key)
+        close_old_connections()
+
+
+def background(key, func, *args):
+    """Выполняет func(*args) в пуле потоков обработки картинок.
+
+    Повторная задача с тем же key не ставится, пока первая не выполнена;
+    при THUMBNAIL_QUEUE задачах в очереди новые отбрасываются.
+    При THUMBNAIL_WORKERS = 0 func выполняется сразу.
+    """
+    if not settings.THUMBNAIL_WORKERS:
+        func(*args)
+        return
+    with _lock:
+        if key in _pending:
+            return
+        if len(_pending) >= settings.THUMBNAIL_QUEUE:
+            logger.warning('Очередь обработки картинок заполнена: %s', key)
+            return
+        _pending.add(key)
+    executor().submit(_run, key, func, args)
+
+
+def precompute(name, geometries, done=None):
+    """Создаёт миниатюры картинки в пуле потоков.
+
+    done вызывается, когда миниатюры готовы: страницы, отрендеренные
+    до этого с исходной картинкой, можно сбросить из кэша.
+    """
+    background(f'thumbnails:{name}', generate, name, geometries, done)
+
+
+class BackgroundThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl-thumbnail, который не обрабатывает картинки при рендере.
+
+    Готовая миниатюра берётся из KVStore, иначе шаблон получает исходную
+    картинку. При THUMBNAIL_WORKERS = 0 миниатюра создаётся при рендере,
+    но одна и та же — только одним потоком за раз.
+    """
+
+    def thumbnail_options(self, source, options):
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        return options
+
+    def thumbnail_name(self, source, geometry_string, options):
+        return self._get_thumbnail_filename(
+            source, geometry_string, self.thumbnail_options(source, options)
+        )
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if not file_:
+            raise ValueError('falsey file_ argument in get_thumbnail()')
+        source = ImageFile(file_)
+        name = self.thumbnail_name(source, geometry_string, dict(options))
+        cached = default.kvstore.get(ImageFile(name, default.storage))
+        if cached:
+            return cached
+        if settings.THUMBNAIL_WORKERS:
+            return source
+        return self.render_thumbnail(file_, geometry_string, options, name)
+
+    def render_thumbnail(self, file_, geometry_string, options, name=None):
+        """Создаёт миниатюру, если её не создаёт другой поток или процесс;
+        иначе после ожидания отдаёт готовую миниатюру или исходную картинку.
+        """
+        if name is None:
+            name = self.thumbnail_name(
+                ImageFile(file_), geometry_string, dict(options)
+            )
+        with single_flight(name) as leader:
+            if leader:
+                return super().get_thumbnail(
+                    file_, geometry_string, **options
+                )
+        thumbnail = default.kvstore.get(ImageFile(name, default.storage))
+        return thumbnail or ImageFile(file_)
+
+
+class LRUKVStore(KVStore):
+    """KVStore sorl-thumbnail с LRU-кэшем в памяти процесса перед cached_db.
+
+    Хранит до THUMBNAIL_LRU_SIZE найденных значений не дольше
+    THUMBNAIL_LRU_TIMEOUT секунд (записи из других процессов видны
+    с этой задержкой); промахи не кэшируются. Попадания и промахи
+    считаются в core.metrics как thumbnail_kvstore.hit / .miss.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lru = OrderedDict()
+        self._lru_lock = threading.Lock()
+
+    def _lru_get(self, key):
+        with self._lru_lock:
+            entry = self._lru.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._lru[key]
+                return None
+            self._lru.move_to_end(key)
+            return value
+
+    def _lru_set(self, key, value):
+        expires = time.monotonic() + settings.THUMBNAIL_LRU_TIMEOUT
+        with self._lru_lock:
+            self._lru[key] = (value, expires)
+            self._lru.move_to_end(key)
+            while len(self._lru) > settings.THUMBNAIL_LRU_SIZE:
+                self._lru.popitem(last=False)
+
+    def _lru_delete(self, *keys):
+        with self._lru_lock:
+            for key in keys:
+                self._lru.pop(key, None)
+
+    def _get_raw(self, key):
+        value = self._lru_get(key)
+        if value is not None:
+            metrics.incr('thumbnail_kvstore.hit')
+            return value
+        metrics.incr('thumbnail_kvstore.miss')
+        value = super()._get_raw(key)
+        if value is not None:
+            self._lru_set(key, value)
+        return value
+
+    def _set_raw(self, key, value):
+        if self.cache.get(key) == EMPTY_VALUE:
+            # промах уже записан в кэш (prefetch или чтение): записи в базе
+            # нет, и get_or_create не нужен лишний SELECT
+            try:
+                with transaction.atomic():
+                    KVStoreModel.objects.create(key=key, value=value)
+            except IntegrityError:
+                KVStoreModel.objects.filter(key=key).update(value=value)
+            self.cache.set(
+                key, value, sorl_settings.THUMBNAIL_CACHE_TIMEOUT
+            )
+        else:
+            super()._set_raw(key, value)
+        self._lru_set(key, value)
+
+    def _delete_raw(self, *keys):
+        super()._delete_raw(*keys)
+        self._lru_delete(*keys)
+
+    def prefetch(self, image_files, sources=()):
+        """Загружает записи image_files разом: одним get_many из кэша
+        и одним запросом к базе за остальными.
+
+        Для картинок sources заодно читаются их записи и списки миниатюр:
+        они нужны, когда миниатюра создаётся при рендере.
+        Найденное попадает в LRU, ненайденное помечается в кэше пустым
+        значением, как это делает cached_db на промахе, — рендер после
+        этого не ходит в базу за каждой картинкой.
+        """
+        raw_keys = [
+            add_prefix(image_file.key, 'image') for image_file in image_files
+        ]
+        for source in sources:
+            raw_keys.append(add_prefix(source.key, 'image'))
+            raw_keys.append(add_prefix(source.key, 'thumbnails'))
+        keys = [
+            key for key in dict.fromkeys(raw_keys)
+            if self._lru_get(key) is None
+        ]
+        if not keys:
+            return
+        values = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            found = dict(KVStoreModel.objects.filter(
+                key__in=missing
+            ).values_list('key', 'value'))
+            self.cache.set_many(
+                {key: found.get(key, EMPTY_VALUE) for key in missing},
+                sorl_settings.THUMBNAIL_CACHE_TIMEOUT
+            )
+            values.update(found)
+        for key, value in values.items():
+            if value != EMPTY_VALUE:
+                self._lru_set(key, value)
+
+    def clear(self, delete_thumbnails=False):
+        super().clear(delete_thumbnails)
+        self.clear_lru()
+
+    def clear_lru(self):
+        with self._lru_lock:
+            self._lru.clear()
+
+    def evict(self, image_file):
+        """Убирает из LRU картинку и все записи её миниатюр."""
+        thumbnail_keys = self._get(image_file.key, identity='thumbnails')
+        self._lru_delete(
+            add_prefix(image_file.key, 'image'),
+            add_prefix(image_file.key, 'thumbnails'),
+            *(add_prefix(key, 'image') for key in thumbnail_keys or ())
+        )
+
+
+def prefetch(names, geometries):
+    """Подгружает записи KVStore о миниатюрах картинок names одним
+    запросом перед рендером страницы со многими картинками.
+
+    При THUMBNAIL_WORKERS = 0 недостающие миниатюры создаются при
+    рендере, поэтому в тот же запрос попадают и записи самих картинок.
+    """
+    backend, kvstore = default.backend, default.kvstore
+    if not (
+        hasattr(kvstore, 'prefetch') and hasattr(backend, 'thumbnail_name')
+    ):
+        return
+    sources = [ImageFile(name) for name in names]
+    kvstore.prefetch(
+        [
+            ImageFile(
+                backend.thumbnail_name(source, geometry, dict(options)),
+                default.storage
+            )
+            for source in sources
+            for geometry, options in geometries
+        ],
+        sources=() if settings.THUMBNAIL_WORKERS else sources
+    )
+
+
+def forget(name):
+    """Сбрасывает закэшированные в процессе записи о картинке name."""
+    if name and hasattr(default.kvstore, 'evict'):
+        default.kvstore.evict(ImageFile(name))
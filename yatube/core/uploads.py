@@ -0,0 +1,81 @@
+import hashlib
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
+
+
+HEADER_SIZE: int = 64 * 1024
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку во временный файл, по пути считая sha256.
+
+    Размер проверяется по мере поступления данных, размеры картинки —
+    по заголовку из первых байт, без декодирования. Отклонённая загрузка
+    превращается в пустой файл с текстом ошибки в upload_error, и данные
+    дальше не пишутся; у принятой в content_hash лежит sha256.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+        self.received = 0
+        self.header = b''
+        self.dimensions = None
+        self.upload_error = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.upload_error:
+            return None
+        self.received += len(raw_data)
+        if self.received > settings.UPLOAD_IMAGE_MAX_SIZE:
+            return self.reject('Файл больше {}'.format(
+                filesizeformat(settings.UPLOAD_IMAGE_MAX_SIZE)
+            ))
+        if self.dimensions is None:
+            self.check_dimensions(raw_data)
+            if self.upload_error:
+                return None
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def check_dimensions(self, raw_data):
+        self.header += raw_data[:HEADER_SIZE - len(self.header)]
+        try:
+            width, height = Image.open(BytesIO(self.header)).size
+        except Image.DecompressionBombError:
+            self.reject('Слишком большое изображение')
+            return
+        except Exception:
+            if len(self.header) >= HEADER_SIZE:
+                self.dimensions = False
+            return
+        self.dimensions = (width, height)
+        if (
+            max(width, height) > settings.UPLOAD_IMAGE_MAX_SIDE
+            or width * height > settings.UPLOAD_IMAGE_MAX_PIXELS
+        ):
+            self.reject(
+                f'Изображение {width}x{height} больше допустимого: сторона '
+                f'до {settings.UPLOAD_IMAGE_MAX_SIDE} пикселей'
+            )
+
+    def reject(self, message):
+        self.upload_error = message
+        self.file.close()
+        return None
+
+    def file_complete(self, file_size):
+        if self.upload_error:
+            rejected = SimpleUploadedFile(
+                self.file_name, b'', self.content_type
+            )
+            rejected.upload_error = self.upload_error
+            return rejected
+        upload = super().file_complete(file_size)
+        upload.content_hash = self.hasher.hexdigest()
+        return upload
@@ -1,5 +1,15 @@
 
+import os
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404
 from django.shortcuts import render
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from core.resize import cache_path, cached_resize, content_type, is_valid
 
 
 def page_not_found(request, exception):
@@ -16,3 +26,39 @@ def server_error(request):
 
 def permission_denied(request, exception):
     return render(request, 'core/403.html', status=403)
+
+
+def resize_image(request, signature, width, height, path):
+    """Картинка из MEDIA_ROOT, уменьшенная до width x height на лету.
+
+    Размеры в адресе подписаны (core.resize.resized_url), уменьшенные
+    копии хранятся в дисковом кэше; поддерживается условный GET.
+    """
+    if (
+        not is_valid(signature, path, width, height)
+        or not 0 < width <= settings.RESIZE_MAX_SIZE
+        or height > settings.RESIZE_MAX_SIZE
+    ):
+        raise Http404
+    try:
+        source = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(source)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404
+    etag = quote_etag(f'{signature}-{int(stat.st_mtime)}-{stat.st_size}')
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime)
+    )
+    if response is None:
+        target = cached_resize(
+            source, cache_path(signature, path, width, height), width, height
+        )
+        if not os.path.exists(target):
+            return FileResponse(open(source, 'rb'))
+        response = FileResponse(
+            open(target, 'rb'), content_type=content_type(target)
+        )
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    patch_cache_control(response, public=True, max_age=settings.RESIZE_MAX_AGE)
+    return response
@@ -1,6 +1,6 @@
-
 from django.contrib import admin
 from .models import Post, Group
+from .search import matching
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -15,6 +15,11 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return matching(queryset, search_term), False
+
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group)
@@ -0,0 +1,130 @@
+import hashlib
+import os
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from sorl.thumbnail import delete as delete_thumbnails
+
+from posts import images, variants
+from posts.models import ImageBlob, Post
+
+
+CHUNK_SIZE: int = 64 * 1024
+
+
+def content_hash(upload):
+    """sha256 загрузки: готовый от HashingUploadHandler или по чанкам."""
+    digest = getattr(upload, 'content_hash', None)
+    if digest:
+        return digest
+    hasher = hashlib.sha256()
+    upload.seek(0)
+    for chunk in upload.chunks(CHUNK_SIZE):
+        hasher.update(chunk)
+    upload.seek(0)
+    return hasher.hexdigest()
+
+
+def blob_name(digest, filename):
+    extension = os.path.splitext(filename)[1].lower()
+    return f'{digest[:2]}/{digest}{extension}'
+
+
+def store(field_file):
+    """Сохраняет новую картинку под хэшем содержимого.
+
+    Если такая картинка уже есть, файл не пишется: поле получает имя
+    существующего файла (с его миниатюрами), а у ImageBlob растёт refcount.
+    Новая картинка перед записью нормализуется (posts.images), хэш при этом
+    остаётся хэшем загруженного файла.
+    """
+    upload = field_file.file
+    digest = content_hash(upload)
+    if acquire(digest):
+        name = ImageBlob.objects.get(sha256=digest).name
+    else:
+        name, size = write(upload, digest, field_file.name)
+        try:
+            with transaction.atomic():
+                ImageBlob.objects.create(
+                    name=name, sha256=digest, size=size, refcount=1
+                )
+        except IntegrityError:
+            acquire(digest)
+            name = ImageBlob.objects.get(sha256=digest).name
+    setattr(field_file.instance, field_file.field.name, name)
+
+
+def write(upload, digest, filename):
+    """Нормализует и пишет файл под хэшем, если его ещё нет в хранилище;
+    возвращает имя и размер. ImageBlob не трогает."""
+    field = Post._meta.get_field('image')
+    name = field.generate_filename(None, blob_name(digest, filename))
+    if field.storage.exists(name):
+        return name, field.storage.size(name)
+    upload = images.normalize(upload)
+    return field.storage.save(name, upload), upload.size
+
+
+def acquire_many(files):
+    """Берёт ссылки на пачку записанных write() файлов.
+
+    files — список (sha256, имя, размер), повторы означают несколько
+    ссылок. Возвращает sha256 -> имя файла, под которым картинка хранится.
+    """
+    counts = Counter(digest for digest, _, _ in files)
+    existing = ImageBlob.objects.in_bulk(list(counts), field_name='sha256')
+    for digest, blob in existing.items():
+        ImageBlob.objects.filter(pk=blob.pk).update(
+            refcount=F('refcount') + counts[digest]
+        )
+    created = {
+        digest: ImageBlob(
+            name=name, sha256=digest, size=size, refcount=counts[digest]
+        )
+        for digest, name, size in files if digest not in existing
+    }
+    ImageBlob.objects.bulk_create(created.values())
+    return {
+        digest: blob.name
+        for digest, blob in {**existing, **created}.items()
+    }
+
+
+def acquire(digest):
+    return ImageBlob.objects.filter(sha256=digest).update(
+        refcount=F('refcount') + 1
+    )
+
+
+def release(name):
+    """Снимает ссылку на картинку; после коммита картинка без ссылок
+    удаляется (collect). Картинки без ImageBlob (загруженные до
+    хэширования) не трогаются."""
+    if not name:
+        return
+    with transaction.atomic():
+        ImageBlob.objects.filter(name=name, refcount__gt=0).update(
+            refcount=F('refcount') - 1
+        )
+        unused = ImageBlob.objects.filter(name=name, refcount=0).exists()
+    if unused:
+        transaction.on_commit(lambda: collect(name))
+
+
+def collect(name):
+    """Удаляет картинку без ссылок вместе с миниатюрами и вариантами.
+
+    До этого строка ImageBlob остаётся с refcount 0: store() и
+    acquire_many() успевают взять на неё ссылку, и тогда файл остаётся.
+    Строка и файл удаляются в одной транзакции, поэтому пришедшие позже
+    строки уже не находят и записывают файл заново.
+    """
+    with transaction.atomic():
+        deleted, _ = ImageBlob.objects.filter(
+            name=name, refcount=0
+        ).delete()
+        if deleted:
+            delete_thumbnails(name)
+            variants.delete_variants(name)
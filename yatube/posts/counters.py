@@ -0,0 +1,66 @@
+from django.db import transaction
+from django.db.models import Count, F, Value
+from django.db.models.functions import Greatest
+
+from posts.models import Follow, Post, UserCounter
+
+
+COUNTER_FIELDS = ('posts_count', 'followers_count', 'following_count')
+
+
+def change(user_id, **deltas):
+    """Сдвигает счётчики пользователя на deltas одним UPDATE с F().
+
+    Вызывается из сигналов внутри транзакции, которая пишет пост или
+    подписку (Post.save, Follow.save, delete). Строки, которых нет или
+    которые разошлись с данными, чинит команда recount_counters.
+    """
+    UserCounter.objects.filter(user_id=user_id).update(**{
+        field: Greatest(F(field) + delta, Value(0))
+        for field, delta in deltas.items()
+    })
+
+
+def count_by(query, field, user_ids):
+    return dict(
+        query.filter(**{f'{field}__in': user_ids}).order_by().values(
+            field
+        ).annotate(total=Count('pk')).values_list(field, 'total')
+    )
+
+
+def actual_counters(user_ids):
+    posts = count_by(Post.objects, 'author_id', user_ids)
+    followers = count_by(Follow.objects, 'author_id', user_ids)
+    following = count_by(Follow.objects, 'user_id', user_ids)
+    return {
+        user_id: UserCounter(
+            user_id=user_id,
+            posts_count=posts.get(user_id, 0),
+            followers_count=followers.get(user_id, 0),
+            following_count=following.get(user_id, 0),
+        )
+        for user_id in user_ids
+    }
+
+
+def recount(user_ids):
+    """Пересчитывает счётчики пачки пользователей; возвращает число
+    исправленных строк."""
+    actual = actual_counters(list(user_ids))
+    stored = UserCounter.objects.in_bulk(list(actual))
+    drifted = [
+        counter for user_id, counter in actual.items()
+        if user_id in stored and any(
+            getattr(counter, field) != getattr(stored[user_id], field)
+            for field in COUNTER_FIELDS
+        )
+    ]
+    missing = [
+        counter for user_id, counter in actual.items()
+        if user_id not in stored
+    ]
+    with transaction.atomic():
+        UserCounter.objects.bulk_update(drifted, COUNTER_FIELDS)
+        UserCounter.objects.bulk_create(missing, ignore_conflicts=True)
+    return len(drifted) + len(missing)
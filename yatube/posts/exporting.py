@@ -0,0 +1,87 @@
+import csv
+import zlib
+from io import StringIO
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from posts.models import Comment, Follow, Group, Post
+
+
+TABLES = {
+    'posts': (Post, (
+        'id', 'author_id', 'group_id', 'text', 'pub_date', 'image',
+        'comment_count',
+    )),
+    'comments': (Comment, ('id', 'post_id', 'author_id', 'text', 'created')),
+    'follows': (Follow, ('id', 'user_id', 'author_id')),
+    'groups': (Group, ('id', 'slug', 'title', 'description')),
+}
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+def batches(table, batch_size):
+    """Строки таблицы пачками по диапазонам pk: каждый запрос читает
+    не больше batch_size строк по индексу, сколько бы их ни было."""
+    model, columns = TABLES[table]
+    last_pk = 0
+    while True:
+        rows = list(model.objects.filter(pk__gt=last_pk).order_by(
+            'pk'
+        ).values_list(*columns)[:batch_size])
+        if not rows:
+            return
+        yield rows
+        last_pk = rows[-1][0]
+
+
+def ndjson_chunks(table, batch_size):
+    _, columns = TABLES[table]
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for rows in batches(table, batch_size):
+        yield ''.join(
+            encoder.encode(dict(zip(columns, row))) + '\n' for row in rows
+        )
+
+
+def csv_chunks(table, batch_size):
+    _, columns = TABLES[table]
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    writer.writerow(columns)
+    yield flush()
+    for rows in batches(table, batch_size):
+        writer.writerows(
+            [
+                value.isoformat() if hasattr(value, 'isoformat') else value
+                for value in row
+            ]
+            for row in rows
+        )
+        yield flush()
+
+
+def export_chunks(table, record_format, batch_size):
+    """Выгрузка таблицы в NDJSON или CSV кусками текста по пачке строк."""
+    if record_format == 'csv':
+        return csv_chunks(table, batch_size)
+    return ndjson_chunks(table, batch_size)
+
+
+def gzip_chunks(chunks, encoding='utf-8'):
+    """Сжимает поток кусков текста в gzip на лету."""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode(encoding))
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,147 @@
+from functools import wraps
+from io import StringIO
+
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed, Rss201rev2Feed
+from django.utils.xmlutils import SimplerXMLGenerator
+from django.views.decorators.http import condition, require_safe
+
+from core.caching import versions_etag, versions_last_modified
+
+
+TITLE_LENGTH: int = 60
+
+
+class StreamingFeedMixin:
+    """Отдаёт ленту по частям: заголовок, затем по записи на итерацию.
+
+    Записи не копятся в self.items, так что в памяти одновременно
+    одна запись, а не вся лента.
+    """
+    encoding = 'utf-8'
+
+    def __init__(self, *args, updated, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.updated = updated
+
+    def latest_post_date(self):
+        return self.updated
+
+    def stream(self, items):
+        buffer = StringIO()
+        handler = SimplerXMLGenerator(buffer, self.encoding)
+
+        def flush():
+            chunk = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return chunk.encode(self.encoding)
+
+        handler.startDocument()
+        self.start_root(handler)
+        self.add_root_elements(handler)
+        yield flush()
+        for item in items:
+            self.items = []
+            self.add_item(**item)
+            self.write_items(handler)
+            yield flush()
+        self.end_root(handler)
+        yield flush()
+
+
+class StreamingRssFeed(StreamingFeedMixin, Rss201rev2Feed):
+    def start_root(self, handler):
+        handler.startElement('rss', self.rss_attributes())
+        handler.startElement('channel', self.root_attributes())
+
+    def end_root(self, handler):
+        self.endChannelElement(handler)
+        handler.endElement('rss')
+
+
+class StreamingAtomFeed(StreamingFeedMixin, Atom1Feed):
+    def start_root(self, handler):
+        handler.startElement('feed', self.root_attributes())
+
+    def end_root(self, handler):
+        handler.endElement('feed')
+
+
+FEED_FORMATS = {
+    'rss': StreamingRssFeed,
+    'atom': StreamingAtomFeed,
+}
+
+
+def conditional_feed(scopes):
+    """ETag и Last-Modified ленты по версиям областей кэша scopes(**kwargs).
+
+    Неизменившаяся лента отдаёт 304, не трогая базу и не собирая XML;
+    время последнего изменения передаётся во view как updated.
+    """
+    etag = versions_etag(scopes)
+    last_modified = versions_last_modified(scopes)
+
+    def decorator(view_func):
+        @require_safe
+        @condition(etag_func=etag, last_modified_func=last_modified)
+        @wraps(view_func)
+        def wrapper(request, feed_format, **kwargs):
+            if feed_format not in FEED_FORMATS:
+                raise Http404
+            updated = last_modified(
+                request, feed_format=feed_format, **kwargs
+            )
+            return view_func(
+                request, feed_format, updated=updated, **kwargs
+            )
+        return wrapper
+    return decorator
+
+
+def feed_posts(query):
+    """Последние POSTS_FEED_ITEMS постов с нужными ленте полями."""
+    return query.select_related('author', 'group').only(
+        'pk', 'text', 'pub_date', 'author', 'group',
+        'author__username', 'author__first_name', 'author__last_name',
+        'group__title',
+    ).order_by('-pub_date', '-pk')[:settings.POSTS_FEED_ITEMS]
+
+
+def post_item(request, post):
+    link = request.build_absolute_uri(
+        reverse('posts:post_detail', args=(post.pk,))
+    )
+    title = post.text.splitlines()[0] if post.text else ''
+    if len(title) > TITLE_LENGTH:
+        title = title[:TITLE_LENGTH - 1] + '…'
+    return {
+        'title': title,
+        'link': link,
+        'unique_id': link,
+        'description': post.text,
+        'pubdate': post.pub_date,
+        'author_name': post.author.get_full_name() or post.author.username,
+        'author_link': request.build_absolute_uri(
+            reverse('posts:profile', args=(post.author.username,))
+        ),
+        'categories': [post.group.title] if post.group else None,
+    }
+
+
+def feed_response(request, feed_format, query, title, link, updated):
+    feed = FEED_FORMATS[feed_format](
+        title=title,
+        link=request.build_absolute_uri(link),
+        description=title,
+        feed_url=request.build_absolute_uri(),
+        language='ru',
+        updated=updated,
+    )
+    items = (post_item(request, post) for post in feed_posts(query))
+    return StreamingHttpResponse(
+        feed.stream(items), content_type=feed.content_type
+    )
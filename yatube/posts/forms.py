@@ -21,6 +21,14 @@ class PostForm(forms.ModelForm):
             )
         return data
 
+    def clean(self):
+        cleaned_data = super().clean()
+        upload_error = getattr(self.files.get('image'), 'upload_error', None)
+        if upload_error:
+            self.errors.pop('image', None)
+            self.add_error('image', upload_error)
+        return cleaned_data
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
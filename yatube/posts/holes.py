@@ -0,0 +1,38 @@
+from core import holes
+from posts.forms import CommentForm
+from posts.models import Follow
+
+
+@holes.register('switcher', 'includes/switcher.html')
+def switcher(request):
+    return {}
+
+
+@holes.register('follow_button', 'includes/follow_button.html')
+def follow_button(request, username):
+    following = (
+        request.user.is_authenticated and Follow.objects.filter(
+            user=request.user,
+            author__username=username
+        ).exists()
+    )
+    return {
+        'username': username,
+        'following': following,
+    }
+
+
+@holes.register('comment_form', 'includes/comment_form.html')
+def comment_form(request, post_id):
+    return {
+        'post_id': post_id,
+        'form': CommentForm(),
+    }
+
+
+@holes.register('post_edit_link', 'includes/post_edit_link.html')
+def post_edit_link(request, post_id, author_id):
+    return {
+        'post_id': post_id,
+        'is_author': str(request.user.pk) == author_id,
+    }
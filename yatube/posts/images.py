@@ -0,0 +1,107 @@
+import base64
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from core import metrics
+
+
+FORMATS = ('JPEG', 'PNG', 'WEBP', 'GIF')
+ORIENTATION_TAG: int = 0x0112
+PLACEHOLDER_SIZE: int = 16
+PLACEHOLDER_QUALITY: int = 40
+
+
+def normalize(upload):
+    """Поворачивает картинку по EXIF, убирает метаданные, уменьшает до
+    UPLOAD_IMAGE_NORMALIZE_MAX_SIDE и пережимает с UPLOAD_IMAGE_QUALITY.
+
+    Возвращает новый файл в том же формате или upload без изменений:
+    для анимаций, неизвестных форматов и когда результат не меньше
+    исходного (если только картинку не пришлось повернуть).
+    """
+    upload.seek(0)
+    try:
+        with Image.open(upload) as image:
+            if (
+                image.format not in FORMATS
+                or getattr(image, 'is_animated', False)
+            ):
+                return upload
+            image_format = image.format
+            icc_profile = image.info.get('icc_profile')
+            rotated = image.getexif().get(ORIENTATION_TAG, 1) != 1
+            image = ImageOps.exif_transpose(image)
+            max_side = settings.UPLOAD_IMAGE_NORMALIZE_MAX_SIDE
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+            if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            output = BytesIO()
+            image.save(
+                output,
+                image_format,
+                quality=settings.UPLOAD_IMAGE_QUALITY,
+                optimize=True,
+                icc_profile=icc_profile
+            )
+    except (OSError, ValueError, Image.DecompressionBombError):
+        upload.seek(0)
+        return upload
+    upload.seek(0)
+    saved = upload.size - output.tell()
+    if saved <= 0 and not rotated:
+        return upload
+    metrics.incr('upload.normalized')
+    # Повёрнутая картинка может стать больше исходной: это не экономия.
+    metrics.incr('upload.saved_bytes', max(saved, 0))
+    return ContentFile(output.getvalue(), name=upload.name)
+
+
+def describe(file):
+    """Ширина, высота, основной цвет и крошечное превью картинки
+    (data: URI c JPEG до PLACEHOLDER_SIZE пикселей по большей стороне).
+    """
+    file.seek(0)
+    with Image.open(file) as image:
+        width, height = image.size
+        image.draft('RGB', (PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+        preview = image.convert('RGB')
+    preview.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.LANCZOS)
+    color = '#{:02x}{:02x}{:02x}'.format(
+        *preview.resize((1, 1), Image.BOX).getpixel((0, 0))
+    )
+    output = BytesIO()
+    preview.save(output, 'JPEG', quality=PLACEHOLDER_QUALITY)
+    placeholder = 'data:image/jpeg;base64,' + base64.b64encode(
+        output.getvalue()
+    ).decode()
+    return {
+        'image_width': width,
+        'image_height': height,
+        'image_color': color,
+        'image_placeholder': placeholder,
+    }
+
+
+def empty():
+    return {
+        'image_width': None,
+        'image_height': None,
+        'image_color': '',
+        'image_placeholder': '',
+    }
+
+
+def fill_metadata(post):
+    """Записывает в поля поста размеры и превью его картинки."""
+    metadata = empty()
+    if post.image:
+        try:
+            with post.image.open('rb') as source:
+                metadata = describe(source)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            pass
+    for field, value in metadata.items():
+        setattr(post, field, value)
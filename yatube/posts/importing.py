@@ -0,0 +1,258 @@
+import csv
+import json
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from PIL import Image
+
+from core.caching import bump
+from posts import blobs, counters, images, search, timeline
+from posts.models import Group, Post, User
+from posts.paginators import invalidate_counts
+
+
+class RecordError(ValueError):
+    pass
+
+
+def read_records(stream, record_format):
+    """Записи JSONL или CSV по одной, с номером строки; битая строка JSONL
+    приходит как None."""
+    if record_format == 'csv':
+        yield from enumerate(csv.DictReader(stream), 2)
+        return
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield number, record if isinstance(record, dict) else None
+
+
+def assign_ids(objs, *fields, batch_size=900):
+    """Проставляет pk объектам после bulk_create там, где база их не
+    возвращает (SQLite): строки выбираются заново по естественному ключу
+    fields, отбор в базе — по первому из них. Из одинаковых по ключу
+    строк объекты получают последние pk, уже бывшие в базе совпадения
+    остаются в стороне."""
+    if not objs or objs[0].pk is not None:
+        return
+    pending = defaultdict(list)
+    for obj in objs:
+        pending[tuple(getattr(obj, field) for field in fields)].append(obj)
+    values = list({getattr(obj, fields[0]) for obj in objs})
+    for start in range(0, len(values), batch_size):
+        rows = type(objs[0]).objects.filter(**{
+            f'{fields[0]}__in': values[start:start + batch_size]
+        }).order_by('-pk').values_list('pk', *fields)
+        for pk, *key in rows:
+            waiting = pending.get(tuple(key))
+            if waiting:
+                waiting.pop().pk = pk
+
+
+def insert_dated(objs, name, *fields):
+    """bulk_create с датами name из objs: auto_now_add перезаписывает их
+    при вставке, поэтому после assign_ids по (name, *fields) даты
+    возвращаются одним bulk_update. Вызывается внутри транзакции."""
+    if not objs:
+        return
+    dates = [getattr(obj, name) for obj in objs]
+    manager = type(objs[0]).objects
+    manager.bulk_create(objs)
+    assign_ids(objs, name, *fields)
+    for obj, date in zip(objs, dates):
+        setattr(obj, name, date)
+    manager.bulk_update(objs, [name])
+
+
+def insert_posts(posts, files, fan_out=True):
+    """Вставляет пачку постов одной транзакцией, без сигналов.
+
+    files — записанные blobs.write() картинки постов: (sha256, имя,
+    размер, поля превью) или None. Ссылки на картинки, поисковый индекс
+    и ленты подписчиков обновляются по пачке целиком. Возвращает id
+    подписчиков, чьи ленты изменились.
+    """
+    with transaction.atomic():
+        names = blobs.acquire_many([
+            image[:3] for image in files if image is not None
+        ])
+        for post, image in zip(posts, files):
+            if image is not None:
+                post.image = names[image[0]]
+                for field, value in image[3].items():
+                    setattr(post, field, value)
+        insert_dated(posts, 'pub_date', 'author_id', 'text')
+        search.index_posts(posts)
+        if not fan_out:
+            return set()
+        return timeline.fan_out_many(posts)
+
+
+def refresh_derived(author_ids, group_ids=(), follower_ids=(),
+                    batch_size=1000):
+    """Один раз после массовой вставки: счётчики пользователей, версии
+    страниц авторов и групп, кэш подсчётов и последних постов авторов."""
+    author_ids = sorted(author_ids)
+    for start in range(0, len(author_ids), batch_size):
+        chunk = author_ids[start:start + batch_size]
+        counters.recount(chunk)
+        for author_id in chunk:
+            timeline.invalidate_recent_keys(author_id)
+        bump(
+            *(f'author:{username}' for username in User.objects.filter(
+                pk__in=chunk
+            ).values_list('username', flat=True)),
+            *(f'user:{pk}' for pk in chunk),
+        )
+        invalidate_counts(*(f'author:{pk}' for pk in chunk))
+    bump('posts', *(
+        f'group:{slug}' for slug in Group.objects.filter(
+            pk__in=list(group_ids)
+        ).values_list('slug', flat=True)
+    ))
+    invalidate_counts(
+        'all',
+        *(f'group:{pk}' for pk in group_ids),
+        *(f'follow:{pk}' for pk in follower_ids),
+    )
+
+
+class PostImporter:
+    """Импорт постов пачками по batch_size.
+
+    Авторы и группы ищутся по словарям в памяти, картинки копируются
+    в workers потоков до начала транзакции пачки, посты вставляются
+    bulk_create без сигналов (insert_posts), счётчики, версии страниц
+    и кэш подсчётов обновляются один раз в finish().
+    """
+
+    def __init__(self, batch_size=1000, workers=4, images_dir='.',
+                 create_authors=False, create_groups=False):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.images_dir = images_dir
+        self.create_authors = create_authors
+        self.create_groups = create_groups
+        self.authors = dict(User.objects.values_list('username', 'pk'))
+        self.groups = dict(Group.objects.values_list('slug', 'pk'))
+        self.imported = 0
+        self.errors = []
+        self.author_ids = set()
+        self.group_ids = set()
+        self.follower_ids = set()
+
+    def run(self, records, progress=None):
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                batch = list(islice(records, self.batch_size))
+                if not batch:
+                    break
+                self.import_batch(batch, executor)
+                if progress:
+                    progress(self.imported, time.monotonic() - started)
+        self.finish()
+
+    def author_id(self, username):
+        if not username:
+            raise RecordError('не указан автор')
+        if username not in self.authors:
+            if not self.create_authors:
+                raise RecordError(f'нет автора {username}')
+            self.authors[username] = User.objects.create_user(username).pk
+        return self.authors[username]
+
+    def group_id(self, slug):
+        if not slug:
+            return None
+        if slug not in self.groups:
+            if not self.create_groups:
+                raise RecordError(f'нет группы {slug}')
+            self.groups[slug] = Group.objects.create(
+                title=slug, slug=slug, description=''
+            ).pk
+        return self.groups[slug]
+
+    def build(self, record):
+        if record is None:
+            raise RecordError('не удалось разобрать запись')
+        text = (record.get('text') or '').strip()
+        if not text:
+            raise RecordError('пустой текст')
+        pub_date = timezone.now()
+        if record.get('pub_date'):
+            try:
+                pub_date = parse_datetime(record['pub_date'])
+            except ValueError:
+                pub_date = None
+            if pub_date is None:
+                raise RecordError(f'неверная дата {record["pub_date"]}')
+            if timezone.is_naive(pub_date):
+                pub_date = timezone.make_aware(pub_date)
+        return Post(
+            text=text,
+            author_id=self.author_id(record.get('author')),
+            group_id=self.group_id(record.get('group')),
+            pub_date=pub_date,
+        ), record.get('image') or None
+
+    def copy_image(self, path):
+        """Пишет картинку в хранилище под её хэшем; возвращает
+        (sha256, имя, размер, поля превью) или RecordError."""
+        if path is None:
+            return None
+        try:
+            with open(os.path.join(self.images_dir, path), 'rb') as source:
+                with Image.open(source):
+                    pass
+                upload = File(source, name=os.path.basename(path))
+                digest = blobs.content_hash(upload)
+                name, size = blobs.write(upload, digest, upload.name)
+            with default_storage.open(name, 'rb') as stored:
+                metadata = images.describe(stored)
+        except (OSError, ValueError, Image.DecompressionBombError) as error:
+            return RecordError(f'картинка {path}: {error}')
+        return digest, name, size, metadata
+
+    def import_batch(self, batch, executor):
+        built = []
+        for number, record in batch:
+            try:
+                built.append((number, *self.build(record)))
+            except RecordError as error:
+                self.errors.append((number, str(error)))
+        copied = executor.map(
+            self.copy_image, [image for _, _, image in built]
+        )
+        posts = []
+        files = []
+        for (number, post, _), image in zip(built, copied):
+            if isinstance(image, RecordError):
+                self.errors.append((number, str(image)))
+                continue
+            posts.append(post)
+            files.append(image)
+        self.follower_ids.update(insert_posts(posts, files))
+        self.imported += len(posts)
+        self.author_ids.update(post.author_id for post in posts)
+        self.group_ids.update(
+            post.group_id for post in posts if post.group_id is not None
+        )
+
+    def finish(self):
+        refresh_derived(
+            self.author_ids, self.group_ids, self.follower_ids,
+            self.batch_size
+        )
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from posts.images import empty, fill_metadata
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Заполняет размеры, цвет и превью картинок постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Сколько постов читать из базы за один проход.'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересчитать и посты, где данные уже есть.'
+        )
+
+    def handle(self, *args, batch_size, force, **options):
+        posts = Post.objects.exclude(image='')
+        if not force:
+            posts = posts.filter(image_width__isnull=True)
+        fields = list(empty())
+        processed = 0
+        last_pk = 0
+        while True:
+            batch = list(posts.filter(pk__gt=last_pk).order_by('pk').only(
+                'pk', 'image'
+            )[:batch_size])
+            if not batch:
+                break
+            for post in batch:
+                fill_metadata(post)
+            Post.objects.bulk_update(batch, fields)
+            processed += len(batch)
+            last_pk = batch[-1].pk
+        self.stdout.write(
+            self.style.SUCCESS(f'Обработано картинок: {processed}')
+        )
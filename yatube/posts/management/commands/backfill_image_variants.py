@@ -0,0 +1,73 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from posts.models import ImageVariant, Post
+from posts.variants import build_variants
+
+
+def build_in_thread(name, force):
+    try:
+        return build_variants(name, force)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Создаёт варианты картинок (ширины и форматы) для постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Сколько картинок обрабатывать параллельно.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Сколько постов читать из базы за один проход.'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересоздать варианты и у постов, где они уже есть.'
+        )
+
+    def handle(self, *args, workers, batch_size, force, **options):
+        posts = Post.objects.exclude(image='')
+        if not force:
+            posts = posts.exclude(
+                image__in=ImageVariant.objects.values('source')
+            )
+        created = 0
+        processed = 0
+        last_pk = 0
+        done = set()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                rows = list(posts.filter(pk__gt=last_pk).order_by(
+                    'pk'
+                ).values_list('pk', 'image')[:batch_size])
+                if not rows:
+                    break
+                # у постов с одним файлом варианты общие
+                names = list(dict.fromkeys(
+                    name for _, name in rows if name not in done
+                ))
+                done.update(names)
+                forces = [force] * len(names)
+                if workers > 1:
+                    created += sum(
+                        executor.map(build_in_thread, names, forces)
+                    )
+                else:
+                    created += sum(map(build_variants, names, forces))
+                processed += len(rows)
+                last_pk = rows[-1][0]
+                self.stdout.write(f'Обработано постов: {processed}')
+        self.stdout.write(
+            self.style.SUCCESS(f'Создано вариантов: {created}')
+        )
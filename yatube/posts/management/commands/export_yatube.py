@@ -0,0 +1,64 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.exporting import CONTENT_TYPES, TABLES, export_chunks, gzip_chunks
+
+
+class Command(BaseCommand):
+    help = 'Выгружает посты, комментарии, подписки и группы в NDJSON или CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'tables',
+            nargs='*',
+            help='Какие таблицы выгрузить ({}); по умолчанию — все.'.format(
+                ', '.join(TABLES)
+            )
+        )
+        parser.add_argument(
+            '--format',
+            dest='record_format',
+            choices=list(CONTENT_TYPES),
+            default='ndjson',
+            help='Формат файлов.'
+        )
+        parser.add_argument(
+            '--gzip',
+            action='store_true',
+            help='Сжимать файлы gzip.'
+        )
+        parser.add_argument(
+            '--output-dir',
+            default='.',
+            help='Каталог для файлов <таблица>.<формат>[.gz].'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.POSTS_EXPORT_BATCH_SIZE,
+            help='Сколько строк читать из базы за один запрос.'
+        )
+
+    def handle(self, *args, tables, record_format, gzip, output_dir,
+               batch_size, **options):
+        unknown = set(tables) - set(TABLES)
+        if unknown:
+            raise CommandError(
+                f'Неизвестные таблицы: {", ".join(sorted(unknown))}'
+            )
+        os.makedirs(output_dir, exist_ok=True)
+        for table in tables or TABLES:
+            chunks = export_chunks(table, record_format, batch_size)
+            path = os.path.join(output_dir, f'{table}.{record_format}')
+            if gzip:
+                chunks = gzip_chunks(chunks)
+                path += '.gz'
+            else:
+                chunks = (chunk.encode('utf-8') for chunk in chunks)
+            with open(path, 'wb') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+            self.stdout.write(f'Выгружено: {path}')
+        self.stdout.write(self.style.SUCCESS('Выгрузка завершена'))
@@ -0,0 +1,115 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.models import User
+from posts.synthetic import LoadGenerator
+
+
+STAGES = {
+    'users': 'Пользователей',
+    'groups': 'Групп',
+    'follows': 'Подписок',
+    'posts': 'Постов',
+    'comments': 'Комментариев',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу воспроизводимыми синтетическими данными '
+        'для нагрузочных тестов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument(
+            '--follows',
+            type=int,
+            default=20000,
+            help='Сколько подписок пытаться создать; повторы отбрасываются.'
+        )
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=30000)
+        parser.add_argument(
+            '--images',
+            type=int,
+            default=0,
+            help='Сколько разных картинок сгенерировать для постов.'
+        )
+        parser.add_argument(
+            '--image-share',
+            type=float,
+            default=0.2,
+            help='Доля постов с картинкой, если --images больше нуля.'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Одинаковый seed даёт одинаковые данные.'
+        )
+        parser.add_argument(
+            '--alpha',
+            type=float,
+            default=1.2,
+            help=(
+                'Показатель степенного закона для подписчиков, групп '
+                'и комментариев: чем больше, тем сильнее перекос.'
+            )
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=365,
+            help='За сколько последних дней распределить посты.'
+        )
+        parser.add_argument(
+            '--prefix',
+            default='load',
+            help='Префикс имён пользователей и адресов групп.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Сколько строк вставлять за один запрос.'
+        )
+        parser.add_argument(
+            '--no-fan-out',
+            action='store_false',
+            dest='fan_out',
+            help='Не раскладывать посты по лентам подписчиков.'
+        )
+
+    def progress(self, stage, created, elapsed):
+        self.stdout.write(
+            f'{STAGES[stage]}: {created} за {elapsed:.1f} с '
+            f'({created / max(elapsed, 0.001):.0f} в секунду)'
+        )
+
+    def handle(self, *args, users, groups, follows, posts, comments, images,
+               image_share, seed, alpha, days, prefix, batch_size, fan_out,
+               **options):
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix} уже есть, '
+                f'укажите другой --prefix'
+            )
+        generator = LoadGenerator(
+            seed=seed,
+            batch_size=batch_size,
+            prefix=prefix,
+            days=days,
+            alpha=alpha,
+            fan_out=fan_out,
+        )
+        counts = generator.run(
+            users, groups, follows, posts, comments,
+            image_pool=images,
+            image_share=image_share,
+            progress=self.progress,
+        )
+        self.stdout.write(self.style.SUCCESS('Готово: ' + ', '.join(
+            f'{STAGES[stage].lower()} {count}'
+            for stage, count in counts.items()
+        )))
@@ -0,0 +1,89 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand
+
+from posts.importing import PostImporter, read_records
+
+
+MAX_REPORTED_ERRORS: int = 20
+
+
+class Command(BaseCommand):
+    help = (
+        'Импортирует посты из JSONL или CSV с полями text, author, group, '
+        'pub_date, image.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Файл с постами; - читает JSONL из stdin.'
+        )
+        parser.add_argument(
+            '--format',
+            dest='record_format',
+            choices=('jsonl', 'csv'),
+            help='Формат файла; по умолчанию — по расширению.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько постов вставлять за одну транзакцию.'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Сколько картинок копировать параллельно.'
+        )
+        parser.add_argument(
+            '--images-dir',
+            default='.',
+            help='Каталог, от которого отсчитываются пути картинок.'
+        )
+        parser.add_argument(
+            '--create-authors',
+            action='store_true',
+            help='Создавать неизвестных авторов вместо пропуска записи.'
+        )
+        parser.add_argument(
+            '--create-groups',
+            action='store_true',
+            help='Создавать неизвестные группы вместо пропуска записи.'
+        )
+
+    def progress(self, imported, elapsed):
+        self.stdout.write(
+            f'Импортировано постов: {imported} '
+            f'({imported / max(elapsed, 0.001):.0f} в секунду)'
+        )
+
+    def handle(self, *args, path, record_format, batch_size, workers,
+               images_dir, create_authors, create_groups, **options):
+        if record_format is None:
+            record_format = (
+                'csv' if path.lower().endswith('.csv') else 'jsonl'
+            )
+        importer = PostImporter(
+            batch_size=batch_size,
+            workers=workers,
+            images_dir=images_dir,
+            create_authors=create_authors,
+            create_groups=create_groups,
+        )
+        if path == '-':
+            records = read_records(sys.stdin, record_format)
+            importer.run(records, self.progress)
+        else:
+            with open(os.path.expanduser(path), encoding='utf-8',
+                      newline='') as stream:
+                records = read_records(stream, record_format)
+                importer.run(records, self.progress)
+        for number, message in importer.errors[:MAX_REPORTED_ERRORS]:
+            self.stderr.write(f'Строка {number}: {message}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано постов: {importer.imported}, '
+            f'пропущено записей: {len(importer.errors)}'
+        ))
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.thumbnails import generate
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Создаёт недостающие миниатюры картинок постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько постов читать из базы за один проход.'
+        )
+
+    def handle(self, *args, batch_size, **options):
+        processed = 0
+        last_pk = 0
+        while True:
+            posts = list(Post.objects.filter(pk__gt=last_pk).exclude(
+                image=''
+            ).order_by('pk').values_list('pk', 'image')[:batch_size])
+            if not posts:
+                break
+            for _, image in posts:
+                generate(image, settings.POSTS_THUMBNAIL_GEOMETRIES)
+            processed += len(posts)
+            last_pk = posts[-1][0]
+        self.stdout.write(
+            self.style.SUCCESS(f'Обработано картинок: {processed}')
+        )
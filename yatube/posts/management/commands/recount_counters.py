@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import recount
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики постов и подписок пользователей.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько пользователей пересчитывать за один проход.'
+        )
+
+    def handle(self, *args, batch_size, **options):
+        fixed = 0
+        last_pk = 0
+        while True:
+            user_ids = list(User.objects.filter(pk__gt=last_pk).order_by(
+                'pk'
+            ).values_list('pk', flat=True)[:batch_size])
+            if not user_ids:
+                break
+            fixed += recount(user_ids)
+            last_pk = user_ids[-1]
+        self.stdout.write(
+            self.style.SUCCESS(f'Исправлено счётчиков: {fixed}')
+        )
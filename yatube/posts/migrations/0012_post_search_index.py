@@ -0,0 +1,69 @@
+import re
+
+from django.db import migrations
+
+
+# Замороженная копия posts.search на момент миграции: дальнейшие правки
+# стеммера не должны менять уже применённые миграции.
+SEARCH_TABLE = 'posts_post_fts'
+WORD_RE = re.compile(r'\w+')
+MIN_STEM = 3
+REFLEXIVE_ENDINGS = ('ся', 'сь')
+ENDINGS = tuple(sorted((
+    'иями', 'ями', 'ами', 'ыми', 'ими', 'его', 'ого', 'ему', 'ому',
+    'ешь', 'ишь', 'ете', 'ите', 'ала', 'ила', 'ыла', 'ело', 'ели',
+    'ее', 'ие', 'ые', 'ое', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом',
+    'ах', 'ях', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею', 'ия', 'ью', 'ов', 'ев',
+    'ам', 'ям', 'ть', 'ет', 'ит', 'ют', 'ут', 'ат', 'ят', 'ла', 'ло', 'ли',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True))
+
+
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    for endings in (REFLEXIVE_ENDINGS, ENDINGS):
+        for ending in endings:
+            if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+                word = word[:-len(ending)]
+                break
+    return word
+
+
+def normalize(text):
+    return ' '.join(stem(word) for word in WORD_RE.findall(text))
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Post = apps.get_model('posts', 'Post')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5('
+            "text, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        cursor.executemany(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, text) VALUES (%s, %s)',
+            [
+                (pk, normalize(text))
+                for pk, text in Post.objects.values_list('pk', 'text')
+            ]
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 2.2.16 on 2026-10-18 09:20
+
+from django.db import migrations, models
+
+
+def fill_sources(apps, schema_editor):
+    """Варианты привязываются к файлу картинки; копии вариантов одного
+    файла у разных постов удаляются вместе с их файлами."""
+    ImageVariant = apps.get_model('posts', 'ImageVariant')
+    storage = ImageVariant._meta.get_field('image').storage
+    rows = list(ImageVariant.objects.order_by('pk').values_list(
+        'pk', 'image', 'width', 'format', 'post__image'
+    ))
+    seen = set()
+    duplicates = []
+    for pk, name, width, image_format, source in rows:
+        key = (source, width, image_format)
+        if key in seen:
+            storage.delete(name)
+            duplicates.append(pk)
+            continue
+        seen.add(key)
+        ImageVariant.objects.filter(pk=pk).update(source=source)
+    for start in range(0, len(duplicates), 500):
+        ImageVariant.objects.filter(
+            pk__in=duplicates[start:start + 500]
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_post_image_metadata'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='imagevariant',
+            name='unique_image_variant',
+        ),
+        migrations.AddField(
+            model_name='imagevariant',
+            name='source',
+            field=models.CharField(default='', max_length=255, verbose_name='Исходная картинка'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_sources, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='imagevariant',
+            options={'ordering': ('source', 'width', 'format')},
+        ),
+        migrations.RemoveField(
+            model_name='imagevariant',
+            name='post',
+        ),
+        migrations.AddConstraint(
+            model_name='imagevariant',
+            constraint=models.UniqueConstraint(fields=('source', 'width', 'format'), name='unique_image_variant'),
+        ),
+    ]
@@ -1,5 +1,5 @@
 
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 
 
@@ -42,12 +42,60 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True,
     )
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки',
+        null=True,
+        blank=True,
+        editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки',
+        null=True,
+        blank=True,
+        editable=False
+    )
+    image_color = models.CharField(
+        'Основной цвет картинки',
+        max_length=7,
+        blank=True,
+        editable=False
+    )
+    image_placeholder = models.TextField(
+        'Превью картинки',
+        blank=True,
+        editable=False
+    )
+    comment_count = models.PositiveIntegerField(
+        'Комментариев',
+        default=0,
+        editable=False
+    )
 
     def __str__(self):
         return self.text[:COUNT_SYMBHOLS_OUTPUT]
 
+    def save(self, *args, **kwargs):
+        # post_save меняет счётчики и ленты: пусть это будет в одной
+        # транзакции с самой записью (delete так работает и без этого).
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='post_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx'
+            ),
+        ]
 
 
 class Comment(models.Model):
@@ -72,6 +120,12 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ('-created',)
+        indexes = [
+            models.Index(
+                fields=['post', '-created', '-id'],
+                name='comment_post_created_idx'
+            ),
+        ]
 
 
 class Follow(models.Model):
@@ -86,6 +140,10 @@ class Follow(models.Model):
         on_delete=models.CASCADE
     )
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     class Meta:
         constraints = [
             models.UniqueConstraint(
@@ -93,3 +151,116 @@ class Follow(models.Model):
                 name='unique_follower'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='follow_author_user_idx'
+            ),
+        ]
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        related_name='feed_entries',
+        on_delete=models.CASCADE
+    )
+    post = models.ForeignKey(
+        Post,
+        related_name='feed_entries',
+        on_delete=models.CASCADE
+    )
+    author = models.ForeignKey(
+        User,
+        related_name='+',
+        on_delete=models.CASCADE
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        ordering = ('-pub_date', '-id')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-id'],
+                name='feed_user_pub_date_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='feed_user_author_idx'
+            ),
+        ]
+
+
+class UserCounter(models.Model):
+    user = models.OneToOneField(
+        User,
+        related_name='counters',
+        on_delete=models.CASCADE,
+        primary_key=True
+    )
+    posts_count = models.PositiveIntegerField(
+        'Постов',
+        default=0
+    )
+    followers_count = models.PositiveIntegerField(
+        'Подписчиков',
+        default=0,
+        db_index=True
+    )
+    following_count = models.PositiveIntegerField(
+        'Подписок',
+        default=0
+    )
+
+
+class ImageVariant(models.Model):
+    source = models.CharField(
+        'Исходная картинка',
+        max_length=255
+    )
+    image = models.ImageField(
+        'Картинка',
+        upload_to='posts/variants/'
+    )
+    format = models.CharField(
+        'Формат',
+        max_length=8
+    )
+    width = models.PositiveIntegerField('Ширина')
+    height = models.PositiveIntegerField('Высота')
+
+    class Meta:
+        ordering = ('source', 'width', 'format')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['source', 'width', 'format'],
+                name='unique_image_variant'
+            )
+        ]
+
+
+class ImageBlob(models.Model):
+    name = models.CharField(
+        'Файл',
+        max_length=255,
+        unique=True
+    )
+    sha256 = models.CharField(
+        'SHA-256',
+        max_length=64,
+        unique=True
+    )
+    size = models.PositiveIntegerField(
+        'Размер',
+        default=0
+    )
+    refcount = models.PositiveIntegerField(
+        'Ссылок',
+        default=0
+    )
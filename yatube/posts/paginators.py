@@ -1,8 +1,283 @@
+import heapq
+from collections.abc import Sequence
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
 from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_bytes, force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+
+CURSOR_SEPARATOR: str = '|'
+COUNT_CACHE_KEY: str = 'posts:count:{}'
+
+
+def encode_cursor(date, pk):
+    """Упаковывает ключ (дата, id) в непрозрачный токен для URL."""
+    raw = f'{date.isoformat()}{CURSOR_SEPARATOR}{pk}'
+    return urlsafe_base64_encode(force_bytes(raw))
+
+
+def decode_cursor(token):
+    """Распаковывает токен курсора; для битого токена и даты без часового
+    пояса (encode_cursor такие не выдаёт) возвращает None."""
+    try:
+        raw = force_str(urlsafe_base64_decode(token))
+        date, pk = raw.rsplit(CURSOR_SEPARATOR, 1)
+        date = parse_datetime(date)
+        pk = int(pk)
+    except (TypeError, ValueError):
+        return None
+    if date is None or date.tzinfo is None:
+        return None
+    return date, pk
+
+
+class CursorPage(Sequence):
+    """Страница курсорной (keyset) пагинации.
+
+    Стоимость выборки не зависит от глубины: запрос всегда
+    `WHERE (date, id) < (курсор) ORDER BY date DESC, id DESC LIMIT n + 1`.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<Cursor page of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def keyset_after(date, pk, date_field='pub_date', id_field='pk'):
+    return (
+        Q(**{f'{date_field}__lt': date})
+        | Q(**{date_field: date, f'{id_field}__lt': pk})
+    )
+
+
+def keyset_before(date, pk, date_field='pub_date', id_field='pk'):
+    return (
+        Q(**{f'{date_field}__gt': date})
+        | Q(**{date_field: date, f'{id_field}__gt': pk})
+    )
+
+
+def keyset_keys(query, limit, after=None, before=None,
+                date_field='pub_date', id_field='pk'):
+    """Ключи (дата, id) после/до курсора одним запросом по индексу.
+
+    Для before ключи возвращаются по возрастанию, иначе — по убыванию.
+    """
+    if before is not None:
+        query = query.filter(
+            keyset_before(*before, date_field, id_field)
+        ).order_by(date_field, id_field)
+    else:
+        if after is not None:
+            query = query.filter(keyset_after(*after, date_field, id_field))
+        query = query.order_by(f'-{date_field}', f'-{id_field}')
+    return list(query.values_list(date_field, id_field)[:limit])
+
+
+class BaseKeysetPaginator:
+    def __init__(self, per_page):
+        self.per_page = per_page
+
+    def _page(self, rows, cursor, backwards):
+        """Собирает CursorPage из per_page + 1 строк в порядке выборки."""
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows = rows[::-1]
+            if not rows:
+                return self.page_after()
+            return CursorPage(
+                self.resolve(rows),
+                encode_cursor(*self.key(rows[-1])),
+                encode_cursor(*self.key(rows[0])) if has_more else None,
+            )
+        return CursorPage(
+            self.resolve(rows),
+            encode_cursor(*self.key(rows[-1])) if has_more else None,
+            encode_cursor(*self.key(rows[0]))
+            if cursor is not None and rows else None,
+        )
+
+    def key(self, row):
+        return row
+
+    def resolve(self, rows):
+        return rows
+
+    def page_after(self, cursor=None):
+        raise NotImplementedError
+
+    def page_before(self, cursor):
+        raise NotImplementedError
+
+    def get_page(self, after=None, before=None):
+        before = decode_cursor(before) if before else None
+        if before is not None:
+            return self.page_before(before)
+        return self.page_after(decode_cursor(after) if after else None)
+
+
+class KeysetPaginator(BaseKeysetPaginator):
+    def __init__(self, query, per_page, date_field='pub_date'):
+        super().__init__(per_page)
+        self.query = query
+        self.date_field = date_field
+
+    def key(self, obj):
+        return getattr(obj, self.date_field), obj.pk
+
+    def page_after(self, cursor=None):
+        query = self.query
+        if cursor is not None:
+            query = query.filter(keyset_after(*cursor, self.date_field))
+        rows = list(query.order_by(
+            f'-{self.date_field}', '-pk'
+        )[:self.per_page + 1])
+        return self._page(rows, cursor, backwards=False)
+
+    def page_before(self, cursor):
+        rows = list(self.query.filter(
+            keyset_before(*cursor, self.date_field)
+        ).order_by(self.date_field, 'pk')[:self.per_page + 1])
+        return self._page(rows, cursor, backwards=True)
+
+
+class MergedKeysetPaginator(BaseKeysetPaginator):
+    """Курсорная пагинация по k-way слиянию упорядоченных потоков ключей.
+
+    streams(limit, after, before) возвращает потоки ключей (дата, id),
+    resolve(keys) превращает итоговые ключи страницы в объекты.
+    """
+
+    def __init__(self, streams, resolve, per_page):
+        super().__init__(per_page)
+        self.streams = streams
+        self.resolve = resolve
+
+    def _merge(self, reverse, **cursor):
+        keys = merge_keys(
+            self.streams(self.per_page + 1, **cursor), reverse=reverse
+        )
+        return list(islice(keys, self.per_page + 1))
+
+    def page_after(self, cursor=None):
+        rows = self._merge(reverse=True, after=cursor)
+        return self._page(rows, cursor, backwards=False)
+
+    def page_before(self, cursor):
+        rows = self._merge(reverse=False, before=cursor)
+        return self._page(rows, cursor, backwards=True)
+
+
+def merge_keys(streams, reverse=True):
+    """Сливает отсортированные потоки ключей, отбрасывая повторы."""
+    previous = None
+    for key in heapq.merge(*streams, reverse=reverse):
+        if key != previous:
+            yield key
+        previous = key
+
+
+def count_cache_key(scope):
+    return COUNT_CACHE_KEY.format(scope)
+
+
+def invalidate_counts(*scopes):
+    cache.delete_many([count_cache_key(scope) for scope in scopes])
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator с кэшированным числом объектов и окном номеров страниц.
+
+    scope задаёт область подсчёта ('all', 'group:<id>', 'author:<id>');
+    кэш сбрасывается сигналами из posts.signals. Ленты подписок
+    ('follow:<id>') кэшируют число сами, см. FollowFeed.count.
+    """
+    ELLIPSIS = '…'
+
+    def __init__(self, object_list, per_page, scope=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.scope = scope
+
+    @cached_property
+    def count(self):
+        if self.scope is None:
+            return Paginator.count.func(self)
+        key = count_cache_key(self.scope)
+        count = cache.get(key)
+        if count is None:
+            count = Paginator.count.func(self)
+            cache.set(key, count, settings.POSTS_COUNT_CACHE_TIMEOUT)
+        return count
+
+    def get_elided_page_range(self, number=1, on_each_side=2, on_ends=1):
+        number = self.validate_number(number)
+        if self.num_pages <= (on_each_side + on_ends) * 2:
+            yield from self.page_range
+            return
+        if number > 1 + on_each_side + on_ends + 1:
+            yield from range(1, on_ends + 1)
+            yield self.ELLIPSIS
+            yield from range(number - on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+        if number < self.num_pages - on_each_side - on_ends - 1:
+            yield from range(number + 1, number + on_each_side + 1)
+            yield self.ELLIPSIS
+            yield from range(
+                self.num_pages - on_ends + 1, self.num_pages + 1
+            )
+        else:
+            yield from range(number + 1, self.num_pages + 1)
+
+
+def is_cursor_request(request):
+    if 'page' in request.GET:
+        return False
+    return (
+        'after' in request.GET
+        or 'before' in request.GET
+        or getattr(settings, 'POSTS_CURSOR_PAGINATION', False)
+    )
 
 
-def paginator(request, query, count_posts):
-    paginator = Paginator(query, count_posts)
+def paginator(request, query, count_posts, scope=None):
+    if is_cursor_request(request):
+        if hasattr(query, 'keyset_paginator'):
+            keyset = query.keyset_paginator(count_posts)
+        else:
+            keyset = KeysetPaginator(query, count_posts)
+        return keyset.get_page(
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+        )
+    paginator = CachedCountPaginator(query, count_posts, scope=scope)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     return page_obj
@@ -0,0 +1,79 @@
+from django.core.cache import cache
+
+from posts.models import Group, Post
+
+
+POST_SCOPES_KEY: str = 'posts:post_scopes:{}'
+
+
+def group_page_scopes(*group_ids):
+    return {
+        f'group:{slug}' for slug in Group.objects.filter(
+            pk__in=[pk for pk in group_ids if pk is not None]
+        ).values_list('slug', flat=True)
+    }
+
+
+def post_scopes(post_id):
+    """Области кэша страницы поста: сам пост, его автор и группа.
+
+    Автор и группа поста запоминаются в кэше (см. remember_post_scopes),
+    а группа входит областью group_id:<pk> — она не зависит от slug.
+    """
+    key = POST_SCOPES_KEY.format(post_id)
+    cached = cache.get(key)
+    if cached is None:
+        cached = Post.objects.filter(pk=post_id).values_list(
+            'author_id', 'group_id'
+        ).first()
+        if cached is None:
+            return [f'post:{post_id}']
+        cache.set(key, cached, None)
+    author_id, group_id = cached
+    scopes = [f'post:{post_id}', f'user:{author_id}']
+    if group_id is not None:
+        scopes.append(f'group_id:{group_id}')
+    return scopes
+
+
+def remember_post_scopes(post):
+    cache.set(
+        POST_SCOPES_KEY.format(post.pk), (post.author_id, post.group_id), None
+    )
+
+
+def group_author_scopes(group):
+    """Области профилей авторов, чьи посты в группе: там ссылки на неё."""
+    return {
+        f'author:{username}' for username in group.posts.order_by(
+        ).values_list('author__username', flat=True).distinct()
+    }
+
+
+def post_page_scopes(post):
+    scopes = {
+        'posts',
+        f'post:{post.pk}',
+        f'author:{post.author.username}',
+        f'user:{post.author_id}',
+    }
+    scopes.update(group_page_scopes(
+        post.group_id, getattr(post, '_loaded_group_id', None)
+    ))
+    return scopes
+
+
+def image_page_scopes(name):
+    """Области страниц всех постов с картинкой name (файлы общие)."""
+    scopes = set()
+    group_ids = set()
+    for post in Post.objects.filter(image=name).select_related('author'):
+        scopes.update({
+            'posts',
+            f'post:{post.pk}',
+            f'author:{post.author.username}',
+            f'user:{post.author_id}',
+        })
+        group_ids.add(post.group_id)
+    scopes.update(group_page_scopes(*group_ids))
+    return scopes
@@ -0,0 +1,166 @@
+import re
+from functools import lru_cache
+
+from django.db import connection
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+
+from posts.models import Post
+
+
+SEARCH_TABLE: str = 'posts_post_fts'
+WORD_RE = re.compile(r'\w+')
+MIN_STEM: int = 3
+STEM_CACHE_SIZE: int = 65536
+REFLEXIVE_ENDINGS = ('ся', 'сь')
+ENDINGS = tuple(sorted((
+    'иями', 'ями', 'ами', 'ыми', 'ими', 'его', 'ого', 'ему', 'ому',
+    'ешь', 'ишь', 'ете', 'ите', 'ала', 'ила', 'ыла', 'ело', 'ели',
+    'ее', 'ие', 'ые', 'ое', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом',
+    'ах', 'ях', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею', 'ия', 'ью', 'ов', 'ев',
+    'ам', 'ям', 'ть', 'ет', 'ит', 'ют', 'ут', 'ат', 'ят', 'ла', 'ло', 'ли',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True))
+
+
+def is_available():
+    """Полнотекстовый индекс есть только на SQLite (FTS5)."""
+    return connection.vendor == 'sqlite'
+
+
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def stem(word):
+    """Лёгкий стеммер: отрезает одно типичное русское окончание.
+
+    Слова повторяются часто, поэтому основы кэшируются.
+    """
+    word = word.lower().replace('ё', 'е')
+    for endings in (REFLEXIVE_ENDINGS, ENDINGS):
+        for ending in endings:
+            if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+                word = word[:-len(ending)]
+                break
+    return word
+
+
+def normalize(text):
+    """Текст для индекса: основы слов через пробел."""
+    return ' '.join(stem(word) for word in WORD_RE.findall(text))
+
+
+def match_expression(query):
+    """Запрос FTS5: все основы из запроса, каждая как префикс."""
+    stems = [stem(word) for word in WORD_RE.findall(query)]
+    return ' '.join(f'"{word}"*' for word in stems)
+
+
+def index_posts(posts):
+    """Добавляет или обновляет записи индекса для постов."""
+    rows = [(post.pk, normalize(post.text)) for post in posts]
+    if not rows or not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s',
+            [(pk,) for pk, _ in rows]
+        )
+        cursor.executemany(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, text) VALUES (%s, %s)',
+            rows
+        )
+
+
+def remove_post(post_id):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [post_id]
+        )
+
+
+def clear():
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+
+
+def rebuild(batch_size=1000):
+    """Перестраивает индекс целиком пачками по pk; возвращает число постов."""
+    clear()
+    indexed = 0
+    last_pk = 0
+    while True:
+        posts = list(Post.objects.filter(pk__gt=last_pk).order_by(
+            'pk'
+        ).only('pk', 'text')[:batch_size])
+        if not posts:
+            break
+        index_posts(posts)
+        indexed += len(posts)
+        last_pk = posts[-1].pk
+    return indexed
+
+
+def matching(queryset, query):
+    """Сужает queryset постов до совпадающих с запросом."""
+    expression = match_expression(query)
+    if not expression:
+        return queryset.none()
+    if not is_available():
+        return queryset.filter(text__icontains=query)
+    # pk__in=RawSQL(...) даёт IN ((SELECT ...)), что SQLite читает как
+    # скалярный подзапрос, поэтому условие — булева аннотация.
+    return queryset.annotate(search_match=RawSQL(
+        f'{Post._meta.db_table}.id IN (SELECT rowid FROM {SEARCH_TABLE} '
+        f'WHERE {SEARCH_TABLE} MATCH %s)',
+        [expression],
+        output_field=BooleanField()
+    )).filter(search_match=True)
+
+
+class SearchResults:
+    """Результаты поиска по релевантности (bm25).
+
+    Поддерживает срезы и count() для Paginator: номера постов страницы
+    берутся из индекса, сами посты — одним запросом по pk.
+    """
+
+    def __init__(self, query, queryset=None):
+        self.expression = match_expression(query)
+        self.query = query
+        if queryset is None:
+            queryset = Post.objects.select_related('author', 'group')
+        self.queryset = queryset
+
+    def count(self):
+        if not self.expression:
+            return 0
+        if not is_available():
+            return matching(self.queryset, self.query).count()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT count(*) FROM {SEARCH_TABLE} '
+                f'WHERE {SEARCH_TABLE} MATCH %s',
+                [self.expression]
+            )
+            return cursor.fetchone()[0]
+
+    def __getitem__(self, index):
+        if not self.expression:
+            return []
+        if not is_available():
+            return list(matching(self.queryset, self.query).order_by(
+                '-pub_date', '-pk'
+            )[index])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {SEARCH_TABLE} '
+                f'WHERE {SEARCH_TABLE} MATCH %s '
+                f'ORDER BY rank LIMIT %s OFFSET %s',
+                [self.expression, index.stop - index.start, index.start]
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        posts = self.queryset.in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
@@ -0,0 +1,227 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.db.models.signals import (
+    post_delete, post_init, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from core import thumbnails
+from core.caching import bump
+from posts import blobs, counters, images, search, timeline, variants
+from posts.models import Comment, Follow, Group, Post, User, UserCounter
+from posts.paginators import invalidate_counts
+from posts.scopes import (
+    group_author_scopes, group_page_scopes, image_page_scopes,
+    post_page_scopes, remember_post_scopes
+)
+
+
+@receiver(post_init, sender=Post)
+def remember_post_fields(sender, instance, **kwargs):
+    instance._loaded_group_id = instance.__dict__.get('group_id')
+    instance._loaded_image = str(instance.__dict__.get('image') or '')
+
+
+@receiver(post_init, sender=Group)
+def remember_slug(sender, instance, **kwargs):
+    instance._loaded_slug = instance.__dict__.get('slug')
+
+
+def shown_name(user):
+    """Поля пользователя, которые видны в карточках постов."""
+    return tuple(
+        user.__dict__.get(field)
+        for field in ('username', 'first_name', 'last_name')
+    )
+
+
+@receiver(post_init, sender=User)
+def remember_username(sender, instance, **kwargs):
+    instance._loaded_username = instance.__dict__.get('username')
+    instance._loaded_name = shown_name(instance)
+
+
+def post_count_scopes(post):
+    scopes = {'all', f'author:{post.author_id}'}
+    for group_id in (post.group_id, getattr(post, '_loaded_group_id', None)):
+        if group_id is not None:
+            scopes.add(f'group:{group_id}')
+    return scopes
+
+
+def follower_count_scopes(author_id):
+    """Кэш подсчёта лент подписчиков автора. Авторов, читаемых слиянием,
+    лента считает по их счётчикам, и кэш не трогается."""
+    if timeline.is_pulled(author_id):
+        return set()
+    return {
+        f'follow:{user_id}' for user_id in Follow.objects.filter(
+            author_id=author_id
+        ).values_list('user_id', flat=True)
+    }
+
+
+def schedule_image_processing(post):
+    name = post.image.name
+
+    def process():
+        if name:
+            thumbnails.precompute(
+                name,
+                settings.POSTS_THUMBNAIL_GEOMETRIES,
+                done=lambda: bump(*image_page_scopes(name))
+            )
+            variants.schedule(name)
+
+    transaction.on_commit(process)
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if instance.image and not instance.image._committed:
+        blobs.store(instance.image)
+        images.fill_metadata(instance)
+    elif not instance.image and instance.image_width is not None:
+        images.fill_metadata(instance)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, update_fields=None, **kwargs):
+    bump(*post_page_scopes(instance))
+    remember_post_scopes(instance)
+    if update_fields is None or 'text' in update_fields:
+        search.index_posts([instance])
+    if (instance.image.name or '') != instance._loaded_image:
+        if not created:
+            thumbnails.forget(instance._loaded_image)
+            blobs.release(instance._loaded_image)
+        schedule_image_processing(instance)
+        instance._loaded_image = instance.image.name or ''
+    scopes = post_count_scopes(instance)
+    if created:
+        counters.change(instance.author_id, posts_count=1)
+        scopes.update(
+            f'follow:{user_id}' for user_id in timeline.fan_out(instance)
+        )
+        timeline.invalidate_recent_keys(instance.author_id)
+    elif instance.group_id == instance._loaded_group_id:
+        return
+    invalidate_counts(*scopes)
+    instance._loaded_group_id = instance.group_id
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.change(instance.author_id, posts_count=-1)
+    search.remove_post(instance.pk)
+    thumbnails.forget(instance.image.name)
+    blobs.release(instance.image.name)
+    bump(*post_page_scopes(instance))
+    scopes = post_count_scopes(instance)
+    scopes.update(follower_count_scopes(instance.author_id))
+    invalidate_counts(*scopes)
+    timeline.invalidate_recent_keys(instance.author_id)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.change(instance.author_id, followers_count=1)
+        counters.change(instance.user_id, following_count=1)
+        timeline.backfill(instance)
+    invalidate_counts(f'follow:{instance.user_id}')
+    bump(
+        f'author:{instance.author.username}',
+        f'author:{instance.user.username}'
+    )
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.change(instance.author_id, followers_count=-1)
+    counters.change(instance.user_id, following_count=-1)
+    timeline.trim(instance)
+    scopes = {f'follow:{instance.user_id}'}
+    if timeline.follower_lost(instance.author_id):
+        scopes.update(follower_count_scopes(instance.author_id))
+    invalidate_counts(*scopes)
+    bump(
+        f'author:{instance.author.username}',
+        f'author:{instance.user.username}'
+    )
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, created=False, **kwargs):
+    """Страницы поста следят за группой через область group_id:<pk>,
+    так что посты группы по одному не сбрасываются."""
+    scopes = {
+        'posts',
+        f'group:{instance.slug}',
+        f'group:{instance._loaded_slug}',
+        f'group_id:{instance.pk}',
+    }
+    if not created and instance.slug != instance._loaded_slug:
+        scopes.update(group_author_scopes(instance))
+    bump(*scopes)
+    instance._loaded_slug = instance.slug
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, **kwargs):
+    bump(*group_author_scopes(instance))
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserCounter.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, created=None, update_fields=None,
+                 **kwargs):
+    """Списки постов сбрасываются, только если изменилось видимое в них
+    имя автора; у удалённого пользователя (created is None) — всегда."""
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    scopes = {
+        f'author:{instance.username}',
+        f'author:{instance._loaded_username}',
+        f'user:{instance.pk}',
+    }
+    if created is None or (
+        not created and shown_name(instance) != instance._loaded_name
+    ):
+        scopes.add('posts')
+        scopes.update(group_page_scopes(
+            *instance.posts.order_by().values_list(
+                'group_id', flat=True
+            ).distinct()
+        ))
+    bump(*scopes)
+    instance._loaded_username = instance.username
+    instance._loaded_name = shown_name(instance)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        Post.objects.filter(pk=instance.post_id).update(
+            comment_count=F('comment_count') + 1
+        )
+    bump(f'post:{instance.post_id}', 'comments')
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    Post.objects.filter(pk=instance.post_id).update(
+        comment_count=Greatest(F('comment_count') - 1, Value(0))
+    )
+    bump(f'post:{instance.post_id}', 'comments')
@@ -0,0 +1,282 @@
+import random
+import time
+from array import array
+from datetime import timedelta
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from faker import Faker
+from PIL import Image, ImageDraw
+
+from posts import blobs, counters, images
+from posts.importing import (
+    assign_ids, insert_dated, insert_posts, refresh_derived
+)
+from posts.models import Comment, Follow, Group, Post, User
+from posts.timeline import PULLED_AUTHORS_KEY
+
+
+LOCALE: str = 'ru_RU'
+SENTENCES: int = 2000
+IMAGE_SIZE = (640, 360)
+# Большое простое число: rank * SCATTER % n — перестановка 0..n-1 при n
+# меньше него, чтобы популярные авторы и посты не шли подряд по pk.
+SCATTER: int = 2654435761
+
+
+def power_law_index(rng, n, alpha):
+    """Индекс 0..n-1 с вероятностью ~ 1 / (индекс + 1) ** alpha.
+
+    Обратная функция непрерывного степенного распределения: без таблиц
+    весов, поэтому годится и для десятков миллионов постов.
+    """
+    u = rng.random()
+    if alpha == 1:
+        rank = n ** u
+    else:
+        rank = ((n ** (1 - alpha) - 1) * u + 1) ** (1 / (1 - alpha))
+    return min(int(rank), n) - 1
+
+
+def scatter(index, n, shift=0):
+    return (index * SCATTER + shift) % n
+
+
+class LoadGenerator:
+    """Детерминированно наполняет базу синтетическими данными.
+
+    Одинаковые seed и параметры дают те же пользователей, группы,
+    подписки, посты и комментарии (даты — относительно начала текущих
+    суток). Подписчики, посты по группам и комментарии распределены
+    по степенному закону с показателем alpha: немного популярных авторов,
+    горячих групп и обсуждаемых постов и длинный хвост остальных.
+    Всё пишется bulk_create пачками по batch_size без сигналов, производные
+    данные (ленты, поиск, счётчики, кэш) обновляются по пачкам и в конце.
+    """
+
+    def __init__(self, seed=0, batch_size=5000, prefix='load', days=365,
+                 alpha=1.2, fan_out=True):
+        self.rng = random.Random(seed)
+        self.faker = Faker(LOCALE)
+        self.faker.seed_instance(seed)
+        self.batch_size = batch_size
+        self.prefix = prefix
+        self.alpha = alpha
+        self.fan_out = fan_out
+        self.end = timezone.now().replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        self.start = self.end - timedelta(days=days)
+        self.sentences = [
+            self.faker.sentence(nb_words=self.rng.randint(4, 14))
+            for _ in range(SENTENCES)
+        ]
+        self.user_ids = array('q')
+        self.group_ids = array('q')
+        self.post_ids = array('q')
+        # секунды от start до pub_date каждого поста из post_ids
+        self.post_offsets = array('d')
+        self.follower_ids = set()
+        self.counts = {}
+
+    def text(self, sentences):
+        return ' '.join(
+            self.rng.choice(self.sentences) for _ in range(sentences)
+        )
+
+    def batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield start, min(self.batch_size, total - start)
+
+    def run(self, users, groups, follows, posts, comments, image_pool=0,
+            image_share=0.0, progress=None):
+        steps = (
+            ('users', self.create_users, users),
+            ('groups', self.create_groups, groups),
+            ('follows', self.create_follows, follows),
+            ('posts', self.create_posts, (posts, image_pool, image_share)),
+            ('comments', self.create_comments, comments),
+        )
+        for stage, step, amount in steps:
+            started = time.monotonic()
+            self.counts[stage] = step(amount)
+            if progress:
+                progress(stage, self.counts[stage], time.monotonic() - started)
+        refresh_derived(
+            self.user_ids, self.group_ids, self.follower_ids, self.batch_size
+        )
+        return self.counts
+
+    def create_users(self, total):
+        password = make_password(None)
+        for start, size in self.batches(total):
+            batch = [
+                User(
+                    username=f'{self.prefix}{number}',
+                    first_name=self.faker.first_name(),
+                    last_name=self.faker.last_name(),
+                    password=password,
+                    date_joined=self.start,
+                )
+                for number in range(start, start + size)
+            ]
+            with transaction.atomic():
+                User.objects.bulk_create(batch)
+                assign_ids(batch, 'username')
+            self.user_ids.extend(user.pk for user in batch)
+        return len(self.user_ids)
+
+    def create_groups(self, total):
+        groups = []
+        for number in range(total):
+            title = self.faker.catch_phrase()[:200]
+            groups.append(Group(
+                title=title,
+                slug=f'{self.prefix}-{number}',
+                description=self.text(2)[:400],
+            ))
+        with transaction.atomic():
+            Group.objects.bulk_create(groups)
+            assign_ids(groups, 'slug')
+        self.group_ids.extend(group.pk for group in groups)
+        return len(groups)
+
+    def create_follows(self, total):
+        """Авторы выбираются по степенному закону, подписчики — равномерно;
+        повторы и подписки на себя отбрасываются, поэтому подписок может
+        получиться меньше total. Счётчики подписчиков пересчитываются
+        сразу: по ним посты решают, раскладываться ли по лентам."""
+        users = len(self.user_ids)
+        if users < 2:
+            return 0
+        before = Follow.objects.count()
+        for _, size in self.batches(total):
+            pairs = set()
+            for _ in range(size):
+                author = self.user_ids[scatter(
+                    power_law_index(self.rng, users, self.alpha), users
+                )]
+                user = self.user_ids[self.rng.randrange(users)]
+                if user != author:
+                    pairs.add((user, author))
+            Follow.objects.bulk_create(
+                [Follow(user_id=user, author_id=author)
+                 for user, author in sorted(pairs)],
+                ignore_conflicts=True
+            )
+        for start, size in self.batches(len(self.user_ids)):
+            counters.recount(self.user_ids[start:start + size])
+        return Follow.objects.count() - before
+
+    def make_image(self, number):
+        image = Image.new('RGB', IMAGE_SIZE, tuple(
+            self.rng.randrange(256) for _ in range(3)
+        ))
+        draw = ImageDraw.Draw(image)
+        width, height = IMAGE_SIZE
+        for _ in range(self.rng.randint(3, 12)):
+            x, y = self.rng.randrange(width), self.rng.randrange(height)
+            box = (x, y, x + self.rng.randint(20, width // 2),
+                   y + self.rng.randint(20, height // 2))
+            fill = tuple(self.rng.randrange(256) for _ in range(3))
+            if self.rng.random() < 0.5:
+                draw.ellipse(box, fill=fill)
+            else:
+                draw.rectangle(box, fill=fill)
+        output = BytesIO()
+        image.save(output, 'JPEG', quality=85)
+        upload = ContentFile(
+            output.getvalue(), name=f'{self.prefix}-{number}.jpg'
+        )
+        digest = blobs.content_hash(upload)
+        name, size = blobs.write(upload, digest, upload.name)
+        with default_storage.open(name, 'rb') as stored:
+            metadata = images.describe(stored)
+        return digest, name, size, metadata
+
+    def create_posts(self, options):
+        """Авторы и группы — по степенному закону; самые пишущие авторы
+        не совпадают с самыми читаемыми, иначе лент получается на порядки
+        больше, чем постов. Даты идут по возрастанию pk, как у постов
+        настоящего сайта; картинки берутся из пула
+        image_pool сгенерированных файлов у доли постов image_share."""
+        total, image_pool, image_share = options
+        users, groups = len(self.user_ids), len(self.group_ids)
+        if not users:
+            return 0
+        pool = [self.make_image(number) for number in range(image_pool)]
+        # Набор популярных авторов мог попасть в кэш до новых подписок.
+        cache.delete(PULLED_AUTHORS_KEY)
+        span = (self.end - self.start) / max(total, 1)
+        for start, size in self.batches(total):
+            posts = []
+            files = []
+            for number in range(start, start + size):
+                author = self.user_ids[scatter(
+                    power_law_index(self.rng, users, self.alpha), users,
+                    users // 2
+                )]
+                group = None
+                if groups and self.rng.random() < 0.7:
+                    group = self.group_ids[
+                        power_law_index(self.rng, groups, self.alpha)
+                    ]
+                posts.append(Post(
+                    text=self.text(self.rng.randint(1, 6)),
+                    author_id=author,
+                    group_id=group,
+                    pub_date=self.start + span * (number + self.rng.random()),
+                ))
+                files.append(
+                    self.rng.choice(pool)
+                    if pool and self.rng.random() < image_share else None
+                )
+            self.follower_ids.update(
+                insert_posts(posts, files, fan_out=self.fan_out)
+            )
+            self.post_ids.extend(post.pk for post in posts)
+            self.post_offsets.extend(
+                (post.pub_date - self.start).total_seconds()
+                for post in posts
+            )
+        return len(self.post_ids)
+
+    def create_comments(self, total):
+        """Посты для комментариев выбираются по степенному закону, авторы —
+        равномерно; комментарий пишется в течение трёх суток после поста,
+        но не позже end. Счётчики comment_count пересчитываются в конце."""
+        posts, users = len(self.post_ids), len(self.user_ids)
+        if not posts:
+            return 0
+        for _, size in self.batches(total):
+            batch = []
+            for _ in range(size):
+                number = scatter(
+                    power_law_index(self.rng, posts, self.alpha), posts
+                )
+                batch.append(Comment(
+                    post_id=self.post_ids[number],
+                    author_id=self.user_ids[self.rng.randrange(users)],
+                    text=self.text(self.rng.randint(1, 3)),
+                    created=min(self.end, self.start + timedelta(
+                        seconds=self.post_offsets[number],
+                        minutes=self.rng.randint(1, 3 * 24 * 60)
+                    )),
+                ))
+            with transaction.atomic():
+                insert_dated(batch, 'created', 'post_id', 'author_id', 'text')
+        Post.objects.filter(
+            pk__gte=self.post_ids[0], pk__lte=self.post_ids[-1]
+        ).update(comment_count=Coalesce(Subquery(
+            Comment.objects.filter(post=OuterRef('pk')).order_by().values(
+                'post'
+            ).annotate(total=Count('pk')).values('total')
+        ), 0))
+        return total
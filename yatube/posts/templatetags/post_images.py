@@ -0,0 +1,36 @@
+from django import template
+
+from posts.variants import FORMATS, variants_of
+
+
+register = template.Library()
+
+
+@register.inclusion_tag('includes/post_picture.html')
+def post_picture(post, lazy=True):
+    """<picture> с вариантами картинки поста по форматам и ширинам.
+
+    Без вариантов остаётся только <img> с миниатюрой sorl-thumbnail.
+    Размеры и превью для <img> берутся из полей поста, файл не читается.
+    """
+    if not post.image:
+        return {'post': post}
+    srcsets = {}
+    for variant in variants_of(post):
+        srcsets.setdefault(variant.format, []).append(
+            f'{variant.image.url} {variant.width}w'
+        )
+    sources = [
+        {
+            'type': f'image/{image_format}',
+            'srcset': ', '.join(srcsets[image_format]),
+        }
+        for image_format in FORMATS
+        if image_format != 'jpeg' and image_format in srcsets
+    ]
+    return {
+        'post': post,
+        'lazy': lazy,
+        'sources': sources,
+        'srcset': ', '.join(srcsets.get('jpeg', [])),
+    }
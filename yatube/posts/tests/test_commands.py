@@ -0,0 +1,339 @@
+import csv
+import gzip
+import json
+import shutil
+import tempfile
+from datetime import timedelta
+from http import HTTPStatus
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db.models import F
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from posts.importing import assign_ids, insert_dated
+from posts.models import (
+    Comment, FeedEntry, Follow, Group, ImageBlob, Post, UserCounter
+)
+from posts.timeline import PULLED_AUTHORS_KEY
+from core.querybudget import QueryRecorder
+
+
+User = get_user_model()
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ImportPostsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='-'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.images_dir = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        Image.new('RGB', (40, 20), 'blue').save(
+            f'{cls.images_dir}/photo.png'
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(cls.images_dir, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def import_posts(self, name, content, *args):
+        path = f'{self.images_dir}/{name}'
+        with open(path, 'w', encoding='utf-8') as source:
+            source.write(content)
+        stdout, stderr = StringIO(), StringIO()
+        call_command(
+            'import_posts', path, '--batch-size=2', '--workers=2',
+            f'--images-dir={self.images_dir}', *args,
+            stdout=stdout, stderr=stderr
+        )
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_jsonl_import_updates_derived_data(self):
+        self.client.get(reverse('posts:profile', args=('author',)))
+        stdout, stderr = self.import_posts('posts.jsonl', '\n'.join([
+            '{"text": "Старая заметка", "author": "author", '
+            '"group": "group", "pub_date": "2015-03-01T10:00:00"}',
+            '{"text": "Заметка с фотографией", "author": "author", '
+            '"image": "photo.png"}',
+            '{"text": "Чужая заметка", "author": "stranger"}',
+            '{"text": "Без даты", "author": "author", "pub_date": "вчера"}',
+            '{"text": "Вторая фотография", "author": "author", '
+            '"image": "photo.png"}',
+            'не json',
+        ]))
+        self.assertIn(
+            'Импортировано постов: 3, пропущено записей: 3', stdout
+        )
+        self.assertIn('Строка 3: нет автора stranger', stderr)
+        old = Post.objects.get(text='Старая заметка')
+        self.assertEqual(old.pub_date.year, 2015)
+        self.assertEqual(old.group, self.group)
+        first, second = Post.objects.filter(
+            text__contains='фотограф'
+        ).order_by('pk')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(ImageBlob.objects.get().refcount, 2)
+        self.assertEqual((first.image_width, first.image_height), (40, 20))
+        self.author.counters.refresh_from_db()
+        self.assertEqual(self.author.counters.posts_count, 3)
+        self.assertEqual(
+            FeedEntry.objects.filter(user=self.reader).count(), 3
+        )
+        response = self.client.get(
+            reverse('posts:search'), {'q': 'заметка'}
+        )
+        self.assertEqual(len(response.context['page_obj']), 2)
+        response = self.client.get(
+            reverse('posts:profile', args=('author',))
+        )
+        self.assertContains(response, 'Старая заметка')
+
+    def test_ids_are_matched_by_natural_key(self):
+        Post.objects.create(text='Повтор', author=self.author)
+        posts = [
+            Post(text=text, author=self.author)
+            for text in ('Повтор', 'Другой')
+        ]
+        Post.objects.bulk_create(posts)
+        # Строка, вставленная другим процессом сразу после пачки.
+        Post.objects.create(text='Чужой', author=self.author)
+        assign_ids(posts, 'pub_date', 'author_id', 'text')
+        stored = Post.objects.in_bulk([post.pk for post in posts])
+        self.assertEqual(
+            [stored[post.pk].text for post in posts], ['Повтор', 'Другой']
+        )
+        self.assertEqual(
+            posts[0].pk, Post.objects.filter(text='Повтор').latest('pk').pk
+        )
+
+    def test_dates_are_kept_on_bulk_insert(self):
+        pub_date = timezone.now() - timedelta(days=30)
+        posts = [Post(text='Архив', author=self.author, pub_date=pub_date)]
+        insert_dated(posts, 'pub_date', 'author_id', 'text')
+        self.assertEqual(Post.objects.get(pk=posts[0].pk).pub_date, pub_date)
+
+    def test_import_fans_out_more_rows_than_sqlite_compound_limit(self):
+        """Пачка из двух постов даёт 600 строк лент за одну вставку:
+        больше, чем SQLite принимает в одном составном SELECT."""
+        readers = User.objects.bulk_create(
+            User(username=f'many{i}') for i in range(299)
+        )
+        Follow.objects.bulk_create(
+            Follow(user=reader, author=self.author)
+            for reader in User.objects.filter(username__startswith='many')
+        )
+        stdout, _ = self.import_posts('posts.jsonl', '\n'.join([
+            '{"text": "Для многих", "author": "author"}',
+            '{"text": "Снова для многих", "author": "author"}',
+        ]))
+        self.assertIn('Импортировано постов: 2', stdout)
+        self.assertEqual(
+            FeedEntry.objects.filter(author=self.author).count(),
+            2 * (len(readers) + 1)
+        )
+
+    def test_csv_import_creates_authors_and_groups(self):
+        stdout, _ = self.import_posts(
+            'posts.csv',
+            'text,author,group\n'
+            'Первый пост,newcomer,new-group\n'
+            'Второй пост,newcomer,\n',
+            '--create-authors', '--create-groups'
+        )
+        self.assertIn(
+            'Импортировано постов: 2, пропущено записей: 0', stdout
+        )
+        newcomer = User.objects.get(username='newcomer')
+        self.assertFalse(newcomer.has_usable_password())
+        self.assertEqual(newcomer.counters.posts_count, 2)
+        self.assertTrue(
+            Post.objects.filter(group__slug='new-group').exists()
+        )
+
+
+class ExportTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.staff = User.objects.create_user(username='staff', is_staff=True)
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='-'
+        )
+        cls.posts = [
+            Post.objects.create(
+                text=f'Пост, "номер" {i}', author=cls.author, group=cls.group
+            )
+            for i in range(5)
+        ]
+        Follow.objects.create(user=cls.staff, author=cls.author)
+        Comment.objects.create(
+            post=cls.posts[0], author=cls.staff, text='Комментарий'
+        )
+
+    def setUp(self):
+        self.staff_client = Client()
+        self.staff_client.force_login(self.staff)
+
+    def download(self, table, **params):
+        response = self.staff_client.get(
+            reverse('posts:export', args=(table,)), params
+        )
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    @override_settings(POSTS_EXPORT_BATCH_SIZE=2)
+    def test_ndjson_export_reads_table_in_batches(self):
+        with QueryRecorder() as recorder:
+            response, content = self.download('posts')
+        rows = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual(
+            [row['id'] for row in rows], [post.pk for post in self.posts]
+        )
+        self.assertEqual(rows[0]['text'], 'Пост, "номер" 0')
+        self.assertEqual(rows[0]['author_id'], self.author.pk)
+        self.assertEqual(
+            len([sql for sql, _ in recorder.queries if 'posts_post' in sql]),
+            4
+        )
+        self.assertIn(
+            'filename="posts.ndjson"', response['Content-Disposition']
+        )
+
+    def test_csv_export(self):
+        _, content = self.download('follows', format='csv')
+        rows = list(csv.reader(content.decode().splitlines()))
+        self.assertEqual(
+            rows, [
+                ['id', 'user_id', 'author_id'],
+                [str(Follow.objects.get().pk), str(self.staff.pk),
+                 str(self.author.pk)],
+            ]
+        )
+
+    def test_gzip_export(self):
+        _, plain = self.download('comments', format='csv')
+        response, compressed = self.download(
+            'comments', format='csv', gzip=1
+        )
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(gzip.decompress(compressed), plain)
+
+    def test_export_is_staff_only(self):
+        client = Client()
+        client.force_login(self.author)
+        response = client.get(reverse('posts:export', args=('posts',)))
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        response = self.staff_client.get(
+            reverse('posts:export', args=('users',))
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_command_writes_files(self):
+        output_dir = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, output_dir, ignore_errors=True)
+        call_command(
+            'export_yatube', 'groups', 'posts', '--gzip', '--batch-size=3',
+            f'--output-dir={output_dir}', stdout=StringIO()
+        )
+        with gzip.open(f'{output_dir}/posts.ndjson.gz', 'rt') as source:
+            self.assertEqual(len(source.readlines()), len(self.posts))
+        with gzip.open(f'{output_dir}/groups.ndjson.gz', 'rt') as source:
+            self.assertEqual(json.loads(source.read())['slug'], 'group')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class GenerateLoadDataTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def generate(self, prefix, seed=7):
+        call_command(
+            'generate_load_data', '--users=30', '--groups=4', '--follows=80',
+            '--posts=60', '--comments=90', '--images=2', '--image-share=0.5',
+            '--batch-size=25', f'--seed={seed}', f'--prefix={prefix}',
+            stdout=StringIO()
+        )
+        return Post.objects.filter(author__username__startswith=prefix)
+
+    def test_generates_consistent_data(self):
+        posts = self.generate('a')
+        self.assertEqual(posts.count(), 60)
+        self.assertEqual(
+            Comment.objects.filter(post__in=posts).count(), 90
+        )
+        self.assertEqual(
+            sum(posts.values_list('comment_count', flat=True)), 90
+        )
+        with_image = posts.exclude(image='')
+        self.assertEqual(
+            sum(ImageBlob.objects.values_list('refcount', flat=True)),
+            with_image.count()
+        )
+        self.assertFalse(with_image.filter(image_width=None).exists())
+        self.assertTrue(FeedEntry.objects.exists())
+        author = posts.first().author
+        self.assertEqual(
+            author.counters.posts_count, author.posts.count()
+        )
+
+    def test_comments_follow_their_posts(self):
+        posts = self.generate('a')
+        comments = Comment.objects.filter(post__in=posts)
+        self.assertFalse(
+            comments.filter(created__lt=F('post__pub_date')).exists()
+        )
+        end = posts.latest('pub_date').pub_date.replace(
+            hour=0, minute=0, second=0, microsecond=0
+        ) + timedelta(days=1)
+        self.assertFalse(comments.filter(created__gt=end).exists())
+
+    @override_settings(POSTS_FEED_PULL_THRESHOLD=5)
+    def test_popular_authors_are_not_fanned_out(self):
+        """Подписки считаются до постов, устаревший кэш не мешает."""
+        cache.set(PULLED_AUTHORS_KEY, frozenset())
+        posts = self.generate('a')
+        pulled = UserCounter.objects.filter(
+            user__username__startswith='a', followers_count__gte=5
+        ).values_list('user_id', flat=True)
+        self.assertTrue(posts.filter(author__in=pulled).exists())
+        self.assertFalse(
+            FeedEntry.objects.filter(author__in=pulled).exists()
+        )
+        self.assertTrue(FeedEntry.objects.exists())
+
+    def test_same_seed_gives_same_data(self):
+        def rows(prefix):
+            return [
+                (text, (slug or '')[1:], name[1:])
+                for text, slug, name in self.generate(prefix).order_by(
+                    'pk'
+                ).values_list('text', 'group__slug', 'author__username')
+            ]
+        self.assertEqual(rows('a'), rows('b'))
+
+    def test_prefix_must_be_new(self):
+        User.objects.create_user(username='load0')
+        with self.assertRaises(CommandError):
+            call_command('generate_load_data', '--users=1', stdout=StringIO())
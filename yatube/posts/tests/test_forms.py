@@ -1,20 +1,35 @@
+import hashlib
 import shutil
 import tempfile
-
+from io import BytesIO
+from unittest import mock
 
 from django.contrib.auth import get_user_model
 from http import HTTPStatus
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
+from django.template.defaultfilters import filesizeformat
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
-from posts.models import Group, Post, Comment
+from PIL import Image
+from core import metrics
+from posts.blobs import blob_name
+from posts.images import normalize
+from posts.models import Group, ImageBlob, Post, Comment
 
 
 User = get_user_model()
 
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -70,7 +85,9 @@ class PostFormTests(TestCase):
             Post.objects.filter(
                 text='Тестовый текст для формы',
                 group=self.group,
-                image='posts/small.gif'
+                image='posts/' + blob_name(
+                    hashlib.sha256(small_gif).hexdigest(), 'small.gif'
+                )
             ).exists()
         )
         self.assertRedirects(response, reverse(
@@ -154,7 +171,9 @@ class PostFormTests(TestCase):
             Post.objects.filter(
                 text='Новейший текст поста!',
                 group=self.group,
-                image='posts/small_edit.gif'
+                image='posts/' + blob_name(
+                    hashlib.sha256(gif_edit).hexdigest(), 'small_edit.gif'
+                )
             )
         )
         self.assertEqual(Post.objects.count(), post_count)
@@ -206,3 +225,141 @@ class PostFormTests(TestCase):
                 text='Тестовый комментарий'
             ).exists()
         )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageUploadTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='uploader')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def upload(self, name='upload.gif'):
+        return self.authorized_client.post(reverse('posts:post_create'), {
+            'text': 'Пост с загруженной картинкой',
+            'image': SimpleUploadedFile(
+                name, SMALL_GIF, content_type='image/gif'
+            ),
+        })
+
+    def test_same_image_is_stored_once(self):
+        self.upload('first.gif')
+        self.upload('second.gif')
+        first, second = Post.objects.filter(author=self.user)
+        self.assertEqual(first.image.name, second.image.name)
+        blob = ImageBlob.objects.get(name=first.image.name)
+        self.assertEqual(blob.refcount, 2)
+        self.assertEqual(blob.sha256, hashlib.sha256(SMALL_GIF).hexdigest())
+
+    def test_file_is_deleted_with_last_post(self):
+        self.upload('first.gif')
+        self.upload('second.gif')
+        first, second = Post.objects.filter(author=self.user)
+        storage, name = first.image.storage, first.image.name
+        with mock.patch('posts.blobs.transaction.on_commit') as on_commit:
+            first.delete()
+            self.assertFalse(on_commit.called)
+            self.assertEqual(ImageBlob.objects.get(name=name).refcount, 1)
+            second.delete()
+        self.assertEqual(ImageBlob.objects.get(name=name).refcount, 0)
+        self.assertTrue(storage.exists(name))
+        on_commit.call_args[0][0]()
+        self.assertFalse(ImageBlob.objects.filter(name=name).exists())
+        self.assertFalse(storage.exists(name))
+
+    def test_upload_during_release_keeps_file(self):
+        """Картинка, загруженная снова до удаления файла, не теряется."""
+        self.upload('first.gif')
+        post = Post.objects.get(author=self.user)
+        storage, name = post.image.storage, post.image.name
+        with mock.patch('posts.blobs.transaction.on_commit') as on_commit:
+            post.delete()
+        self.upload('second.gif')
+        on_commit.call_args[0][0]()
+        post = Post.objects.get(author=self.user)
+        self.assertEqual(post.image.name, name)
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(ImageBlob.objects.get(name=name).refcount, 1)
+
+    @override_settings(UPLOAD_IMAGE_MAX_SIZE=16)
+    def test_too_large_file_is_rejected(self):
+        response = self.upload()
+        self.assertFormError(
+            response, 'form', 'image', 'Файл больше ' + filesizeformat(16)
+        )
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(ImageBlob.objects.exists())
+
+    @override_settings(UPLOAD_IMAGE_MAX_SIDE=1)
+    def test_too_large_image_is_rejected(self):
+        response = self.upload()
+        self.assertFormError(
+            response, 'form', 'image',
+            'Изображение 2x1 больше допустимого: сторона до 1 пикселей'
+        )
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(UPLOAD_IMAGE_NORMALIZE_MAX_SIDE=100)
+    def test_photo_is_normalized(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        photo = BytesIO()
+        Image.new('RGB', (400, 200), 'red').save(
+            photo, 'JPEG', quality=100, exif=exif
+        )
+        saved_bytes = metrics.get('upload.saved_bytes')
+        self.authorized_client.post(reverse('posts:post_create'), {
+            'text': 'Пост с фотографией с телефона',
+            'image': SimpleUploadedFile(
+                'photo.jpg', photo.getvalue(), content_type='image/jpeg'
+            ),
+        })
+        post = Post.objects.get(author=self.user)
+        with post.image.open('rb') as stored, Image.open(stored) as image:
+            self.assertEqual(image.size, (50, 100))
+            self.assertFalse(image.getexif())
+        self.assertEqual(
+            metrics.get('upload.saved_bytes') - saved_bytes,
+            len(photo.getvalue()) - post.image.size
+        )
+
+    def test_grown_rotated_photo_saves_nothing(self):
+        """Повёрнутое фото, ставшее больше, не уменьшает saved_bytes."""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        photo = BytesIO()
+        Image.effect_noise((200, 100), 64).convert('RGB').save(
+            photo, 'JPEG', quality=10, exif=exif
+        )
+        saved_bytes = metrics.get('upload.saved_bytes')
+        normalized = normalize(SimpleUploadedFile(
+            'photo.jpg', photo.getvalue(), content_type='image/jpeg'
+        ))
+        self.assertGreater(normalized.size, len(photo.getvalue()))
+        self.assertEqual(metrics.get('upload.saved_bytes'), saved_bytes)
+
+    def test_animated_gif_is_kept(self):
+        frames = [Image.new('P', (4, 4), color) for color in (1, 2)]
+        animation = BytesIO()
+        frames[0].save(
+            animation, 'GIF', save_all=True, append_images=frames[1:]
+        )
+        self.authorized_client.post(reverse('posts:post_create'), {
+            'text': 'Пост с анимированной картинкой',
+            'image': SimpleUploadedFile(
+                'animation.gif', animation.getvalue(),
+                content_type='image/gif'
+            ),
+        })
+        post = Post.objects.get(author=self.user)
+        with post.image.open('rb') as stored:
+            self.assertEqual(stored.read(), animation.getvalue())
@@ -0,0 +1,259 @@
+import os
+import shutil
+import tempfile
+from http import HTTPStatus
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from core import metrics
+from core.resize import resized_url, scan
+from posts.models import ImageVariant, Post
+from posts.variants import build_variants, supported_formats, variant_sizes
+from sorl.thumbnail.default import kvstore
+
+
+User = get_user_model()
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ImageVariantTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.post = self.create_post()
+
+    def create_post(self):
+        output = BytesIO()
+        Image.new('RGB', (1000, 400), 'red').save(output, 'PNG')
+        with mock.patch('posts.signals.transaction.on_commit'):
+            return Post.objects.create(
+                text='Пост с большой картинкой',
+                author=self.user,
+                image=SimpleUploadedFile(
+                    'big.png', output.getvalue(), content_type='image/png'
+                )
+            )
+
+    def variants(self):
+        return ImageVariant.objects.filter(source=self.post.image.name)
+
+    def test_variants_are_built_and_used_in_markup(self):
+        """Варианты картинки создаются по ширинам и попадают в srcset."""
+        call_command(
+            'backfill_image_variants', workers=1, stdout=StringIO()
+        )
+        widths = settings.POSTS_IMAGE_VARIANT_WIDTHS
+        self.assertEqual(
+            self.variants().count(), len(widths) * len(supported_formats())
+        )
+        variant = self.variants().get(format='jpeg', width=320)
+        self.assertEqual((variant.width, variant.height), (320, 113))
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, f'{variant.image.url} 320w')
+
+    def test_cached_pages_show_variants_once_built(self):
+        """Страницы, закэшированные до вариантов, получают srcset."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:post_detail', args=(self.post.pk,)),
+        )
+        for url in urls:
+            self.assertNotContains(self.client.get(url), ' 320w')
+        build_variants(self.post.image.name)
+        variant = self.variants().get(format='jpeg', width=320)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(
+                    self.client.get(url), f'{variant.image.url} 320w'
+                )
+
+    def test_variants_are_shared_and_deleted_with_file(self):
+        """Посты с одним файлом делят варианты; они удаляются вместе
+        с файлом, когда на него не остаётся ссылок."""
+        copy = self.create_post()
+        self.assertEqual(copy.image.name, self.post.image.name)
+        created = build_variants(self.post.image.name)
+        self.assertEqual(build_variants(copy.image.name), 0)
+        self.assertEqual(self.variants().count(), created)
+        names = [variant.image.name for variant in self.variants()]
+        storage = self.post.image.storage
+        self.post.delete()
+        self.assertEqual(self.variants().count(), created)
+        with mock.patch('posts.blobs.transaction.on_commit') as on_commit:
+            copy.delete()
+        on_commit.call_args[0][0]()
+        self.assertFalse(self.variants().exists())
+        for name in names:
+            self.assertFalse(storage.exists(name))
+
+    def test_narrow_image_gets_single_variant(self):
+        self.assertEqual(variant_sizes(200), [(320, 113)])
+        self.assertEqual(variant_sizes(700), [(320, 113), (640, 226)])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ResizeImageURLTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.path = 'posts/resize.png'
+        os.makedirs(os.path.join(TEMP_MEDIA_ROOT, 'posts'), exist_ok=True)
+        Image.new('RGB', (800, 400), 'blue').save(
+            os.path.join(TEMP_MEDIA_ROOT, cls.path)
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def open_image(self, response):
+        return Image.open(BytesIO(b''.join(response.streaming_content)))
+
+    def test_image_is_resized_by_signed_url(self):
+        """Подписанный адрес отдаёт уменьшенную копию из кэша."""
+        url = resized_url(self.path, 200, 100)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(self.open_image(response).size, (200, 100))
+        response = self.client.get(resized_url(self.path, 100, 0))
+        self.assertEqual(self.open_image(response).size, (100, 50))
+        hits = metrics.get('resize.hit')
+        self.client.get(url)
+        self.assertEqual(metrics.get('resize.hit'), hits + 1)
+
+    def test_content_type_matches_written_format(self):
+        """Копия BMP записывается как PNG и отдаётся как image/png."""
+        path = 'posts/resize.bmp'
+        Image.new('RGB', (80, 40), 'green').save(
+            os.path.join(TEMP_MEDIA_ROOT, path)
+        )
+        response = self.client.get(resized_url(path, 40, 0))
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(self.open_image(response).format, 'PNG')
+        response = self.client.get(resized_url(self.path, 40, 0))
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+    def test_resized_filter_builds_signed_url(self):
+        template = Template("{% load resize %}{{ image|resized:'200x100' }}")
+        image = mock.Mock()
+        image.name = self.path
+        self.assertEqual(
+            template.render(Context({'image': image})),
+            resized_url(self.path, 200, 100)
+        )
+
+    def test_unsigned_sizes_are_rejected(self):
+        url = resized_url(self.path, 200, 100).replace('200x100', '201x100')
+        self.assertEqual(
+            self.client.get(url).status_code, HTTPStatus.NOT_FOUND
+        )
+        with override_settings(RESIZE_MAX_SIZE=100):
+            response = self.client.get(resized_url(self.path, 200, 100))
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        response = self.client.get(resized_url('../settings.py', 200, 100))
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_conditional_get(self):
+        url = resized_url(self.path, 300, 150)
+        response = self.client.get(url)
+        response = self.client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_cache_size_is_capped(self):
+        for width in (50, 60, 70, 80):
+            self.client.get(resized_url(self.path, width, 0))
+        with override_settings(RESIZE_CACHE_MAX_SIZE=1):
+            self.client.get(resized_url(self.path, 90, 0))
+        self.assertLessEqual(len(scan()), 1)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=2)
+class ImageMetadataTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        kvstore.clear_lru()
+        output = BytesIO()
+        Image.new('RGB', (300, 100), 'red').save(output, 'PNG')
+        with mock.patch('posts.signals.transaction.on_commit'):
+            self.post = Post.objects.create(
+                text='Пост с красной картинкой',
+                author=self.user,
+                image=SimpleUploadedFile(
+                    'red.png', output.getvalue(), content_type='image/png'
+                )
+            )
+
+    def test_metadata_is_stored_on_upload(self):
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual((post.image_width, post.image_height), (300, 100))
+        self.assertEqual(post.image_color, '#ff0000')
+        self.assertTrue(
+            post.image_placeholder.startswith('data:image/jpeg;base64,')
+        )
+
+    def test_markup_does_not_open_image(self):
+        """Размеры и превью в разметке берутся из базы, а не из файла."""
+        with mock.patch.object(
+            self.post.image.storage, 'open', side_effect=AssertionError
+        ):
+            response = self.client.get(reverse('posts:index'))
+            detail = self.client.get(
+                reverse('posts:post_detail', args=(self.post.pk,))
+            )
+        self.assertContains(response, 'width="300" height="100"')
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, 'background: #ff0000 url(')
+        self.assertContains(detail, 'width="300" height="100"')
+        self.assertNotContains(detail, 'loading="lazy"')
+
+    def test_command_backfills_metadata(self):
+        Post.objects.update(
+            image_width=None, image_height=None,
+            image_color='', image_placeholder=''
+        )
+        call_command('backfill_image_metadata', stdout=StringIO())
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual((post.image_width, post.image_height), (300, 100))
+        self.assertEqual(post.image_color, '#ff0000')
+
+    def test_metadata_is_cleared_with_image(self):
+        self.post.image = ''
+        with mock.patch('posts.signals.transaction.on_commit'):
+            self.post.save()
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertIsNone(post.image_width)
+        self.assertEqual(post.image_placeholder, '')
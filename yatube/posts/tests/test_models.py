@@ -1,6 +1,11 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import DatabaseError
 from django.test import TestCase
 from django.contrib.auth import get_user_model
-from posts.models import Post, Group
+from posts.models import Post, Group, Follow, UserCounter
 
 
 User = get_user_model()
@@ -54,3 +59,52 @@ class PostModelTest(TestCase):
             with self.subTest(value=value):
                 help_text = self.post._meta.get_field(value).help_text
                 self.assertEqual(help_text, expected)
+
+
+class UserCounterTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def assertCounters(self, user, posts, followers, following):
+        counters = UserCounter.objects.get(user=user)
+        self.assertEqual(
+            (
+                counters.posts_count,
+                counters.followers_count,
+                counters.following_count
+            ),
+            (posts, followers, following)
+        )
+
+    def test_counters_follow_changes(self):
+        """Счётчики меняются вместе с постами и подписками."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertCounters(self.author, 1, 1, 0)
+        self.assertCounters(self.reader, 0, 0, 1)
+        post.delete()
+        follow.delete()
+        self.assertCounters(self.author, 0, 0, 0)
+        self.assertCounters(self.reader, 0, 0, 0)
+
+    def test_counters_share_transaction_with_write(self):
+        with mock.patch(
+            'posts.counters.change', side_effect=DatabaseError
+        ):
+            with self.assertRaises(DatabaseError):
+                Post.objects.create(author=self.author, text='Пост')
+            with self.assertRaises(DatabaseError):
+                Follow.objects.create(user=self.reader, author=self.author)
+        self.assertFalse(Post.objects.filter(author=self.author).exists())
+        self.assertFalse(Follow.objects.exists())
+
+    def test_recount_command_fixes_drift(self):
+        Post.objects.create(author=self.author, text='Пост')
+        UserCounter.objects.filter(user=self.author).update(posts_count=7)
+        UserCounter.objects.filter(user=self.reader).delete()
+        call_command('recount_counters', batch_size=1, stdout=StringIO())
+        self.assertCounters(self.author, 1, 0, 0)
+        self.assertCounters(self.reader, 0, 0, 0)
@@ -0,0 +1,220 @@
+import shutil
+import tempfile
+from http import HTTPStatus
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from core.querybudget import QueryRecorder
+from core.testing import QueryBudgetTestMixin
+from core.thumbnails import generate
+from posts.models import Comment, Follow, Group, Post
+from posts.urls import urlpatterns
+from PIL import Image
+from sorl.thumbnail.default import kvstore
+from sorl.thumbnail.images import ImageFile
+
+
+User = get_user_model()
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def image_upload(color):
+    output = BytesIO()
+    Image.new('RGB', (40, 20), color).save(output, 'PNG')
+    return SimpleUploadedFile('image.png', output.getvalue(), 'image/png')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=2)
+class PostURLsPerformanceTest(QueryBudgetTestMixin, TestCase):
+    COUNT_AUTHORS = 5
+    COUNT_POSTS = 30
+    COUNT_COMMENTS = 30
+    # у скольких первых постов миниатюры созданы заранее
+    PRECOMPUTED = COUNT_POSTS // 2
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.authors = [
+            User.objects.create_user(username=f'author{i}')
+            for i in range(cls.COUNT_AUTHORS)
+        ]
+        cls.groups = [
+            Group.objects.create(
+                title=f'Группа {i}', slug=f'group{i}', description='-'
+            )
+            for i in range(2)
+        ]
+        for author in cls.authors[1:]:
+            Follow.objects.create(user=cls.reader, author=author)
+        cls.posts = [
+            Post.objects.create(
+                text=f'Пост номер {i}',
+                author=cls.authors[i % cls.COUNT_AUTHORS],
+                group=cls.groups[i % 2],
+                image=image_upload((i, i, i)) if i % 3 else None,
+            )
+            for i in range(cls.COUNT_POSTS)
+        ]
+        cls.post = cls.posts[0]
+        for post in cls.posts[1:cls.PRECOMPUTED]:
+            if post.image:
+                generate(
+                    post.image.name, settings.POSTS_THUMBNAIL_GEOMETRIES
+                )
+        for i in range(cls.COUNT_COMMENTS):
+            Comment.objects.create(
+                post=cls.post,
+                author=cls.authors[i % cls.COUNT_AUTHORS],
+                text=f'Комментарий {i}'
+            )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_login(self.reader)
+        cache.clear()
+        kvstore.clear_lru()
+
+    def url_kwargs(self):
+        return {
+            'group_list': {'slug': self.groups[0].slug},
+            'profile': {'username': self.post.author.username},
+            'post_detail': {'post_id': self.post.pk},
+            'post_edit': {'post_id': self.post.pk},
+            'add_comment': {'post_id': self.post.pk},
+            'post_comments': {'post_id': self.post.pk},
+            'export': {'table': 'posts'},
+            'index_feed': {'feed_format': 'rss'},
+            'group_feed': {
+                'slug': self.groups[0].slug, 'feed_format': 'atom'
+            },
+            'profile_feed': {
+                'username': self.post.author.username, 'feed_format': 'rss'
+            },
+            'profile_follow': {'username': self.authors[0].username},
+            'profile_unfollow': {'username': self.authors[1].username},
+        }
+
+    def test_views_stay_within_query_budget(self):
+        """Все страницы posts.urls укладываются в свой бюджет запросов."""
+        kwargs = self.url_kwargs()
+        for pattern in urlpatterns:
+            url = reverse(
+                f'posts:{pattern.name}', kwargs=kwargs.get(pattern.name)
+            )
+            with self.subTest(url=url):
+                self.assertWithinQueryBudget(self.client, url)
+                self.assertWithinQueryBudget(self.client, url + '?page=2')
+
+    def test_pulled_follow_feed_stays_within_budget(self):
+        """Лента с авторами, читаемыми слиянием: все (порог 0) и по
+        числу подписчиков, когда список таких авторов не в кэше."""
+        url = reverse('posts:follow_index')
+        for threshold in (0, 1):
+            for url in (url, url + '?page=2', url + '?after='):
+                with self.subTest(threshold=threshold, url=url):
+                    cache.clear()
+                    with override_settings(
+                        POSTS_FEED_PULL_THRESHOLD=threshold
+                    ):
+                        self.assertWithinQueryBudget(self.client, url)
+
+    def test_writes_stay_within_query_budget(self):
+        """Создание и правка поста с картинкой и комментарий укладываются
+        в бюджет."""
+        post = self.posts[1]
+        self.client.force_login(post.author)
+        writes = (
+            ('post_create', {}, {
+                'text': 'Новый пост с картинкой для подписчиков',
+                'group': self.groups[0].pk,
+                'image': image_upload('red'),
+            }),
+            ('post_edit', {'post_id': post.pk}, {
+                'text': 'Правка поста с новой картинкой',
+                'group': self.groups[1].pk,
+                'image': image_upload('blue'),
+            }),
+            ('add_comment', {'post_id': post.pk}, {'text': 'Ещё'}),
+        )
+        for name, kwargs, data in writes:
+            url = reverse(f'posts:{name}', kwargs=kwargs)
+            with self.subTest(url=url):
+                response = self.assertWithinQueryBudget(
+                    self.client, url, data
+                )
+                self.assertEqual(response.status_code, HTTPStatus.FOUND)
+
+    def test_views_use_indexes(self):
+        """Запросы страниц posts.urls идут по индексам, без сортировок."""
+        kwargs = self.url_kwargs()
+        full_scans = {
+            'post_create': ('posts_group',),
+            'post_edit': ('posts_group',),
+        }
+        for pattern in urlpatterns:
+            url = reverse(
+                f'posts:{pattern.name}', kwargs=kwargs.get(pattern.name)
+            )
+            allow_scans = full_scans.get(pattern.name, ())
+            with self.subTest(url=url):
+                self.assertQueriesUseIndexes(
+                    self.client, url, allow_scans=allow_scans
+                )
+                self.assertQueriesUseIndexes(
+                    self.client, url + '?page=2', allow_scans=allow_scans
+                )
+
+    def test_search_stays_within_budget_and_uses_indexes(self):
+        url = reverse('posts:search') + '?q=пост'
+        for url in (url, url + '&page=2'):
+            with self.subTest(url=url):
+                self.assertWithinQueryBudget(self.client, url)
+                self.assertQueriesUseIndexes(self.client, url)
+
+    def test_recorder_detects_n_plus_one(self):
+        with QueryRecorder() as recorder:
+            for post in Post.objects.all():
+                post.group.slug
+        self.assertEqual(
+            list(recorder.repeated().values()), [self.COUNT_POSTS]
+        )
+
+
+@override_settings(THUMBNAIL_WORKERS=0)
+class PostURLsSyncThumbnailsPerformanceTest(PostURLsPerformanceTest):
+    """Те же бюджеты, когда миниатюры создаются при рендере, как при
+    DEBUG: миниатюры в базе есть, но кэш и LRU их ещё не видели."""
+    PRECOMPUTED = PostURLsPerformanceTest.COUNT_POSTS
+
+    def test_new_thumbnails_are_looked_up_in_one_query(self):
+        """Создание миниатюр при рендере не читает KVStore по картинке."""
+        posts = [
+            Post.objects.create(
+                text='Пост с новой картинкой',
+                author=self.authors[0],
+                image=image_upload(color)
+            )
+            for color in ('red', 'green', 'blue')
+        ]
+        with QueryRecorder() as recorder:
+            self.client.get(reverse('posts:index'))
+        lookups = [
+            sql for sql, _ in recorder.queries
+            if sql.startswith('SELECT') and 'thumbnail_kvstore' in sql
+        ]
+        self.assertEqual(len(lookups), 1)
+        for post in posts:
+            self.assertIsNotNone(kvstore.get(ImageFile(post.image.name)))
@@ -0,0 +1,74 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from posts.models import Post
+
+
+User = get_user_model()
+
+
+COUNT_CREATE_POSTS = 13
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.cats = Post.objects.create(
+            text='Кошки и коты: кошка спит, кот ест', author=cls.user
+        )
+        cls.cat = Post.objects.create(
+            text='Про котов и собак', author=cls.user
+        )
+        cls.dog = Post.objects.create(text='Собака лает', author=cls.user)
+
+    def search(self, query, **params):
+        return self.client.get(
+            reverse('posts:search'), {'q': query, **params}
+        ).context['page_obj']
+
+    def test_search_ranks_word_forms(self):
+        """Поиск находит словоформы и ставит выше более релевантные."""
+        self.assertEqual(list(self.search('котами')), [self.cats, self.cat])
+        self.assertEqual(list(self.search('собаки')), [self.dog, self.cat])
+        self.assertEqual(list(self.search('кот собака')), [self.cat])
+        self.assertEqual(list(self.search('?!')), [])
+
+    def test_index_follows_post_changes(self):
+        post = Post.objects.get(pk=self.dog.pk)
+        post.text = 'Ёжик в тумане'
+        post.save()
+        self.assertEqual(list(self.search('ежики')), [post])
+        self.assertNotIn(post, self.search('собака'))
+        post.delete()
+        self.assertEqual(list(self.search('ежик')), [])
+
+    def test_pages_keep_query(self):
+        Post.objects.bulk_create(
+            Post(text=f'Кот номер {i}', author=self.user)
+            for i in range(COUNT_CREATE_POSTS)
+        )
+        call_command('rebuild_search_index', batch_size=5, stdout=StringIO())
+        response = self.client.get(reverse('posts:search'), {'q': 'кот'})
+        self.assertEqual(
+            response.context['page_obj'].paginator.count,
+            COUNT_CREATE_POSTS + 2
+        )
+        self.assertContains(response, '?q=%D0%BA%D0%BE%D1%82&amp;page=2')
+        self.assertEqual(len(self.search('кот', page=2)), 5)
+
+    def test_admin_search_uses_index(self):
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'коты'}
+        )
+        self.assertEqual(
+            set(response.context['cl'].result_list), {self.cats, self.cat}
+        )
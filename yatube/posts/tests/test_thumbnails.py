@@ -0,0 +1,202 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from posts.models import Post
+from sorl.thumbnail.default import kvstore
+from sorl.thumbnail.images import ImageFile
+from core import metrics
+from core.querybudget import QueryRecorder
+from core.thumbnails import lock_path, single_flight
+
+
+User = get_user_model()
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+RED_GIF = SMALL_GIF.replace(b'\xFF\xFF\xFF', b'\xFF\x00\x00', 1)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=2)
+class BackgroundThumbnailTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        kvstore.clear_lru()
+        with mock.patch('posts.signals.transaction.on_commit') as on_commit:
+            self.post = Post.objects.create(
+                text='Пост с картинкой',
+                author=self.user,
+                image=SimpleUploadedFile(
+                    'thumb.gif', SMALL_GIF, content_type='image/gif'
+                )
+            )
+        self.process_image = on_commit.call_args[0][0]
+
+    def page_image(self):
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,))
+        )
+        return response.context['post'].image, response.content.decode()
+
+    def test_page_shows_original_until_thumbnail_is_ready(self):
+        """Страница не ждёт миниатюру, а показывает исходную картинку."""
+        image, content = self.page_image()
+        self.assertIn(f'src="{image.url}"', content)
+
+    def test_thumbnail_is_precomputed_after_save(self):
+        with override_settings(THUMBNAIL_WORKERS=0):
+            self.process_image()
+        image, content = self.page_image()
+        self.assertNotIn(f'src="{image.url}"', content)
+        self.assertIn('src="/media/cache/', content)
+
+    def test_cached_pages_are_refreshed_when_thumbnail_is_ready(self):
+        """Страницы, закэшированные с исходной картинкой, сбрасываются,
+        когда фоновая миниатюра готова."""
+        image, content = self.page_image()
+        self.assertIn(f'src="{image.url}"', content)
+        with override_settings(THUMBNAIL_WORKERS=0):
+            self.process_image()
+        for url in (
+            reverse('posts:post_detail', args=(self.post.pk,)),
+            reverse('posts:index'),
+        ):
+            with self.subTest(url=url):
+                content = self.client.get(url).content.decode()
+                self.assertNotIn(f'src="{image.url}"', content)
+                self.assertIn('src="/media/cache/', content)
+
+    def test_command_precomputes_missing_thumbnails(self):
+        call_command('precompute_thumbnails', stdout=StringIO())
+        image, content = self.page_image()
+        self.assertIn('src="/media/cache/', content)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ThumbnailKVStoreTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        kvstore.clear_lru()
+        self.post = Post.objects.create(
+            text='Пост с картинкой',
+            author=self.user,
+            image=SimpleUploadedFile(
+                'lru.gif', SMALL_GIF, content_type='image/gif'
+            )
+        )
+        self.client.get(reverse('posts:index'))
+        cache.clear()
+
+    def test_feed_makes_no_thumbnail_lookups_when_warm(self):
+        """Прогретая лента не ходит в KVStore миниатюр."""
+        misses = metrics.get('thumbnail_kvstore.miss')
+        hits = metrics.get('thumbnail_kvstore.hit')
+        with QueryRecorder() as recorder:
+            self.client.get(reverse('posts:index'))
+        self.assertFalse([
+            sql for sql, _ in recorder.queries if 'thumbnail_kvstore' in sql
+        ])
+        self.assertEqual(metrics.get('thumbnail_kvstore.miss'), misses)
+        self.assertGreater(metrics.get('thumbnail_kvstore.hit'), hits)
+
+    def test_image_change_evicts_old_entries(self):
+        old_key = ImageFile(self.post.image.name).key
+        self.assertTrue(any(old_key in key for key in kvstore._lru))
+        self.post.image = SimpleUploadedFile(
+            'lru2.gif', RED_GIF, content_type='image/gif'
+        )
+        self.post.save()
+        self.assertFalse(any(old_key in key for key in kvstore._lru))
+
+
+@override_settings(THUMBNAIL_LOCK_WAIT=0.1)
+class ThumbnailSingleFlightTest(SimpleTestCase):
+    key = 'cache/ab/cd/thumbnail.jpg'
+
+    def setUp(self):
+        cache.clear()
+
+    def test_only_one_thread_renders(self):
+        """Пока миниатюру делает один поток, другие её не делают."""
+        started = threading.Event()
+        finish = threading.Event()
+
+        def render():
+            with single_flight(self.key) as leader:
+                self.assertTrue(leader)
+                started.set()
+                finish.wait(5)
+
+        thread = threading.Thread(target=render)
+        thread.start()
+        started.wait(5)
+        with single_flight(self.key) as leader:
+            self.assertFalse(leader)
+        finish.set()
+        thread.join()
+        with single_flight(self.key) as leader:
+            self.assertTrue(leader)
+
+    def test_lock_is_shared_between_processes(self):
+        """Блокировка видна другому процессу, у которого свой кэш."""
+        path = lock_path(self.key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        holder = subprocess.Popen(
+            [sys.executable, '-c', (
+                'import fcntl, sys\n'
+                f'lock = open({path!r}, "ab")\n'
+                'fcntl.flock(lock, fcntl.LOCK_EX)\n'
+                'print("locked", flush=True)\n'
+                'sys.stdin.read()\n'
+            )],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+        )
+        try:
+            self.assertEqual(holder.stdout.readline().strip(), 'locked')
+            with single_flight(self.key) as leader:
+                self.assertFalse(leader)
+        finally:
+            holder.communicate('')
+        with single_flight(self.key) as leader:
+            self.assertTrue(leader)
+        self.assertFalse(os.path.exists(path))
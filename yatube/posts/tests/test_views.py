@@ -1,15 +1,26 @@
 
 import shutil
 import tempfile
+from datetime import datetime
+from http import HTTPStatus
+from xml.etree import ElementTree
 
 from django import forms
+from django.template.loader import render_to_string
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase, Client, override_settings
+from django.test import Client, TestCase, override_settings
 from django.conf import settings
-from posts.models import Post, Group, Follow
+from posts.models import Comment, FeedEntry, Follow, Group, Post
+from posts.paginators import (
+    CachedCountPaginator, count_cache_key, decode_cursor, encode_cursor
+)
+from posts.timeline import FollowFeed, recent_keys
+from posts.views import COUNT_COMMENTS
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
+from core.caching import get_versions
+from core.querybudget import QueryRecorder
 
 
 User = get_user_model()
@@ -172,15 +183,125 @@ class PostViewsTest(TestCase):
         )
         content = self.authorized_client.get(
             reverse('posts:index')).content
-        post.delete()
-        content_delete = self.authorized_client.get(
+        Post.objects.filter(pk=post.pk).update(text='Без сигналов')
+        content_cached = self.authorized_client.get(
             reverse('posts:index')).content
-        self.assertEqual(content, content_delete)
+        self.assertEqual(content, content_cached)
         cache.clear()
         content_after_cache_cleared = self.authorized_client.get(
             reverse('posts:index')).content
         self.assertNotEqual(content, content_after_cache_cleared)
 
+    def test_cache_invalidated_on_changes(self):
+        """Страницы сбрасываются сразу при изменении их содержимого."""
+        post = Post.objects.create(
+            text='Текст для тестирование кэша',
+            author=self.user,
+            group=self.group
+        )
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.guest_client.get(url), post.text)
+        post.delete()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertNotContains(
+                    self.guest_client.get(url), post.text
+                )
+        self.user.first_name = 'Роман'
+        self.user.save()
+        self.assertContains(
+            self.guest_client.get(reverse('posts:index')), 'Роман'
+        )
+
+    def test_group_change_keeps_post_versions(self):
+        """Правка группы обновляет страницу поста через область группы,
+        а смена slug — и профили авторов со ссылками на неё."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        profile = reverse('posts:profile', kwargs={'username': self.user})
+        self.guest_client.get(url)
+        self.guest_client.get(profile)
+        post_version = get_versions(f'post:{self.post.pk}')
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = 'Новое название'
+        group.slug = 'new_slug'
+        group.save()
+        self.assertEqual(get_versions(f'post:{self.post.pk}'), post_version)
+        self.assertContains(self.guest_client.get(url), 'Новое название')
+        self.assertContains(
+            self.guest_client.get(profile),
+            reverse('posts:group_list', kwargs={'slug': 'new_slug'})
+        )
+
+    def test_only_name_changes_reset_post_lists(self):
+        """Регистрация и вход не сбрасывают списки постов, смена имени —
+        сбрасывает."""
+        version = get_versions('posts')
+        user = User.objects.create_user(username='newcomer')
+        user.last_login = user.date_joined
+        user.email = 'newcomer@example.com'
+        user.save()
+        self.assertEqual(get_versions('posts'), version)
+        user.first_name = 'Новичок'
+        user.save()
+        self.assertNotEqual(get_versions('posts'), version)
+
+    def test_cached_shell_is_personalised(self):
+        """
+        Общий каркас страницы дополняется фрагментами для пользователя.
+        """
+        other = User.objects.create_user(username='other_reader')
+        other_client = Client()
+        other_client.force_login(other)
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        author_page = self.authorized_client.get(url)
+        self.assertContains(author_page, 'редактировать пост')
+        with self.assertNumQueries(2):
+            other_page = other_client.get(url)
+        self.assertContains(other_page, 'Пользователь: other_reader')
+        self.assertNotContains(other_page, 'Пользователь: R0man')
+        self.assertNotContains(other_page, 'редактировать пост')
+        self.assertContains(self.guest_client.get(url), 'Войти')
+
+    def test_comments_are_paginated(self):
+        """Комментарии отдаются пачками с авторами и счётчиком."""
+        Comment.objects.bulk_create([
+            Comment(post=self.post, author=self.user, text=f'Комм {i}')
+            for i in range(COUNT_COMMENTS + 5)
+        ])
+        Post.objects.filter(pk=self.post.pk).update(
+            comment_count=COUNT_COMMENTS + 5
+        )
+        response = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        comments = response.context['comments']
+        self.assertEqual(len(comments), COUNT_COMMENTS)
+        self.assertContains(response, f'Комментарии: {COUNT_COMMENTS + 5}')
+        url = reverse('posts:post_comments', kwargs={'post_id': self.post.pk})
+        with self.assertNumQueries(2):
+            more = self.guest_client.get(
+                url, {'after': comments.next_cursor, 'format': 'json'}
+            ).json()
+        self.assertEqual(len(more['comments']), 5)
+        self.assertIsNone(more['next'])
+        self.assertEqual(more['comments'][0]['author'], self.user.username)
+
+    def test_comment_count_follows_comments(self):
+        comment = Comment.objects.create(
+            post=self.post, author=self.user, text='Комментарий'
+        )
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+        comment.delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
+
 
 class PostPaginatorTest(TestCase):
     @classmethod
@@ -230,6 +351,86 @@ class PostPaginatorTest(TestCase):
                     len(response.context['page_obj']), count_posts
                 )
 
+    def test_cursor_pages_contain_records(self):
+        """
+        Курсорная пагинация: 10 постов, затем 3 и возврат назад.
+        """
+        url = reverse('posts:index')
+        first = self.authorized_client.get(url, {'after': ''})
+        page_obj = first.context['page_obj']
+        self.assertTrue(page_obj.is_cursor)
+        self.assertEqual(len(page_obj), 10)
+        self.assertFalse(page_obj.has_previous())
+        second = self.authorized_client.get(
+            url, {'after': page_obj.next_cursor}
+        )
+        second_page = second.context['page_obj']
+        self.assertEqual(len(second_page), 3)
+        self.assertFalse(second_page.has_next())
+        self.assertFalse(
+            set(page_obj.object_list) & set(second_page.object_list)
+        )
+        back = self.authorized_client.get(
+            url, {'before': second_page.previous_cursor}
+        )
+        self.assertEqual(
+            list(back.context['page_obj']), list(page_obj)
+        )
+        links = render_to_string('includes/paginator.html', {
+            'page_obj': second_page, 'page_query': 'q=x&'
+        })
+        self.assertIn('href="?q=x&amp;">', links)
+        self.assertIn('href="?q=x&amp;before=', links)
+
+    def test_count_is_cached_and_invalidated(self):
+        """Число постов берётся из кэша и сбрасывается новым постом."""
+        url = reverse('posts:group_list', kwargs={'slug': 'test_slug'})
+        self.authorized_client.get(url)
+        self.assertEqual(
+            cache.get(count_cache_key(f'group:{self.group.pk}')),
+            COUNT_CREATE_POSTS
+        )
+        Post.objects.create(text='Ещё пост', author=self.user,
+                            group=self.group)
+        self.assertIsNone(
+            cache.get(count_cache_key(f'group:{self.group.pk}'))
+        )
+        response = self.authorized_client.get(url)
+        self.assertEqual(
+            response.context['page_obj'].paginator.count,
+            COUNT_CREATE_POSTS + 1
+        )
+
+    def test_elided_page_range(self):
+        paginator = CachedCountPaginator(range(1000), 10)
+        ellipsis = CachedCountPaginator.ELLIPSIS
+        self.assertEqual(
+            list(paginator.get_elided_page_range(50)),
+            [1, ellipsis, 48, 49, 50, 51, 52, ellipsis, 100]
+        )
+        self.assertEqual(
+            list(paginator.get_elided_page_range(1)),
+            [1, 2, 3, ellipsis, 100]
+        )
+
+    def test_broken_cursor_returns_first_page(self):
+        response = self.authorized_client.get(
+            reverse('posts:index'), {'after': 'broken'}
+        )
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+    def test_naive_cursor_is_rejected(self):
+        """Дата курсора без часового пояса не доходит до запроса."""
+        naive = encode_cursor(datetime(2020, 1, 1), 1)
+        self.assertIsNone(decode_cursor(naive))
+        response = self.authorized_client.get(
+            reverse('posts:index'), {'after': naive}
+        )
+        self.assertEqual(len(response.context['page_obj']), 10)
+        post = Post.objects.first()
+        aware = encode_cursor(post.pub_date, post.pk)
+        self.assertEqual(decode_cursor(aware), (post.pub_date, post.pk))
+
 
 class FollowTest(TestCase):
     @classmethod
@@ -253,6 +454,21 @@ class FollowTest(TestCase):
         self.authorized_follower.force_login(self.follower)
         cache.clear()
 
+    def test_fan_out_to_many_followers(self):
+        """Пост раскладывается в ленты больше 500 подписчиков (предел
+        строк одного INSERT в SQLite)."""
+        readers = User.objects.bulk_create(
+            User(username=f'reader{i}') for i in range(600)
+        )
+        Follow.objects.bulk_create(
+            Follow(user=reader, author=self.author_post)
+            for reader in User.objects.filter(username__startswith='reader')
+        )
+        post = Post.objects.create(text='Всем', author=self.author_post)
+        self.assertEqual(
+            FeedEntry.objects.filter(post=post).count(), len(readers)
+        )
+
     def test_profile_follow_views(self):
         """
         Тестирование подписки на автора один и только один раз.
@@ -324,3 +540,310 @@ class FollowTest(TestCase):
             reverse('posts:follow_index')
         )
         self.assertNotIn(self.post, response.context['page_obj'].object_list)
+
+    def test_new_post_fans_out_to_followers(self):
+        """
+        Новый пост попадает в ленту подписчика, отписка её очищает.
+        """
+        Follow.objects.create(
+            author=self.author_post,
+            user=self.follower
+        )
+        post = Post.objects.create(
+            text='Пост после подписки',
+            author=self.author_post
+        )
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.follower, post=post).exists()
+        )
+        self.assertFalse(
+            FeedEntry.objects.filter(user=self.author_post).exists()
+        )
+        self.authorized_follower.get(
+            reverse(
+                'posts:profile_unfollow',
+                kwargs={'username': self.author_post}
+            )
+        )
+        self.assertFalse(
+            FeedEntry.objects.filter(user=self.follower).exists()
+        )
+
+
+@override_settings(POSTS_FEED_PULL_THRESHOLD=2)
+class FollowFeedPullChangeTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.readers = [
+            User.objects.create_user(username=f'reader{i}') for i in range(2)
+        ]
+        for reader in cls.readers:
+            Follow.objects.create(user=reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_pulled_author_posts_are_counted_without_resetting_cache(self):
+        """Посты автора, читаемого слиянием, считаются по его счётчику:
+        кэш подсчёта лент подписчиков при этом не сбрасывается."""
+        reader = self.readers[0]
+        key = count_cache_key(f'follow:{reader.pk}')
+        self.assertEqual(FollowFeed(reader).count(), 0)
+        cached = cache.get(key)
+        post = Post.objects.create(text='Пост', author=self.author)
+        self.assertEqual(cache.get(key), cached)
+        self.assertEqual(FollowFeed(reader).count(), 1)
+        post.delete()
+        self.assertEqual(cache.get(key), cached)
+        self.assertEqual(FollowFeed(reader).count(), 0)
+
+    def test_author_below_threshold_is_fanned_out_again(self):
+        post = Post.objects.create(text='Пост', author=self.author)
+        self.assertFalse(FeedEntry.objects.filter(post=post).exists())
+        Follow.objects.filter(user=self.readers[1]).delete()
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.readers[0], post=post).exists()
+        )
+        newer = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.readers[0], post=newer).exists()
+        )
+
+
+@override_settings(POSTS_FEED_PULL_THRESHOLD=0, POSTS_FEED_AUTHOR_RECENT=3)
+class FollowFeedPullTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.authors = [
+            User.objects.create_user(username=f'author{i}')
+            for i in range(3)
+        ]
+        for author in cls.authors:
+            Follow.objects.create(user=cls.reader, author=author)
+        cls.posts = [
+            Post.objects.create(
+                text=f'Пост {i}', author=cls.authors[i % 3]
+            )
+            for i in range(COUNT_CREATE_POSTS)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.reader)
+        cache.clear()
+
+    def expected_order(self):
+        return list(Post.objects.filter(
+            author__in=self.authors
+        ).order_by('-pub_date', '-pk'))
+
+    def test_pulled_posts_are_not_fanned_out(self):
+        self.assertFalse(
+            FeedEntry.objects.filter(
+                user=self.reader, post__in=self.posts
+            ).exists()
+        )
+
+    def test_pages_are_merged_from_authors(self):
+        """Страницы ленты собираются слиянием постов авторов."""
+        url = reverse('posts:follow_index')
+        first = self.client.get(url).context['page_obj']
+        second = self.client.get(url, {'page': 2}).context['page_obj']
+        self.assertEqual(first.paginator.count, COUNT_CREATE_POSTS)
+        self.assertEqual(
+            list(first) + list(second), self.expected_order()
+        )
+
+    def test_recent_keys_are_read_in_one_query(self):
+        """Последние посты всех авторов без кэша читаются одним запросом."""
+        author_ids = [author.pk for author in self.authors]
+        with QueryRecorder() as recorder:
+            keys = recent_keys(author_ids)
+        self.assertEqual(len(recorder), 1)
+        for author in self.authors:
+            self.assertEqual(keys[author.pk], [
+                (post.pub_date, post.pk)
+                for post in Post.objects.filter(
+                    author=author
+                ).order_by('-pub_date', '-pk')[:3]
+            ])
+        with QueryRecorder() as recorder:
+            self.assertEqual(recent_keys(author_ids), keys)
+        self.assertEqual(len(recorder), 0)
+
+    def test_cursor_pages_are_merged_from_authors(self):
+        url = reverse('posts:follow_index')
+        first = self.client.get(url, {'after': ''}).context['page_obj']
+        second = self.client.get(
+            url, {'after': first.next_cursor}
+        ).context['page_obj']
+        self.assertFalse(second.has_next())
+        self.assertEqual(
+            list(first) + list(second), self.expected_order()
+        )
+        back = self.client.get(
+            url, {'before': second.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(back), list(first))
+
+
+@override_settings(POSTS_FEED_ITEMS=3)
+class FeedTest(TestCase):
+    ATOM = '{http://www.w3.org/2005/Atom}'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='author', first_name='Лев', last_name='Толстой'
+        )
+        cls.group = Group.objects.create(
+            title='Классики', slug='classics', description='-'
+        )
+        cls.posts = [
+            Post.objects.create(
+                text=f'Запись номер {i}\nВторая строка',
+                author=cls.user,
+                group=cls.group if i % 2 else None,
+            )
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def fetch(self, url, **headers):
+        with QueryRecorder() as recorder:
+            response = self.client.get(url, **headers)
+            content = b''.join(getattr(response, 'streaming_content', []))
+        return response, content, len(recorder)
+
+    def test_rss_feed_streams_latest_posts(self):
+        response, content, queries = self.fetch(
+            reverse('posts:index_feed', args=('rss',))
+        )
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            response['Content-Type'], 'application/rss+xml; charset=utf-8'
+        )
+        items = ElementTree.fromstring(content).findall('channel/item')
+        self.assertEqual(
+            [item.findtext('title') for item in items],
+            ['Запись номер 4', 'Запись номер 3', 'Запись номер 2']
+        )
+        self.assertEqual(items[1].findtext('category'), 'Классики')
+        self.assertEqual(queries, 1)
+
+    def test_group_atom_feed(self):
+        response, content, _ = self.fetch(
+            reverse('posts:group_feed', args=('classics', 'atom'))
+        )
+        feed = ElementTree.fromstring(content)
+        self.assertEqual(
+            feed.findtext(f'{self.ATOM}title'), 'Yatube: Классики'
+        )
+        entries = feed.findall(f'{self.ATOM}entry')
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(
+            entries[0].findtext(f'{self.ATOM}author/{self.ATOM}name'),
+            'Лев Толстой'
+        )
+
+    def test_unchanged_feed_is_not_modified(self):
+        url = reverse('posts:profile_feed', args=('author', 'atom'))
+        response, _, _ = self.fetch(url)
+        for headers in (
+            {'HTTP_IF_NONE_MATCH': response['ETag']},
+            {'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']},
+        ):
+            with self.subTest(headers=headers):
+                cached, content, queries = self.fetch(url, **headers)
+                self.assertEqual(
+                    cached.status_code, HTTPStatus.NOT_MODIFIED
+                )
+                self.assertEqual((content, queries), (b'', 0))
+        Post.objects.create(text='Новая запись', author=self.user)
+        changed, _, _ = self.fetch(
+            url, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(changed.status_code, HTTPStatus.OK)
+
+    def test_unknown_feed_format(self):
+        response = self.client.get(
+            reverse('posts:index_feed', args=('json',))
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class ConditionalPageTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.post = Post.objects.create(text='Пост', author=cls.author)
+        cls.post_url = reverse('posts:post_detail', args=(cls.post.pk,))
+        cls.profile_url = reverse('posts:profile', args=('author',))
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def revalidate(self, client, url, etag):
+        with QueryRecorder() as recorder:
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        return response.status_code, len(recorder)
+
+    def test_unchanged_pages_are_not_modified(self):
+        for url in (self.post_url, self.profile_url):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertIn('Last-Modified', response)
+                self.assertIn('no-cache', response['Cache-Control'])
+                self.assertIn('private', response['Cache-Control'])
+                self.assertEqual(
+                    self.revalidate(self.client, url, response['ETag']),
+                    (HTTPStatus.NOT_MODIFIED, 0)
+                )
+
+    def test_etag_depends_on_user(self):
+        etag = self.client.get(self.post_url)['ETag']
+        self.assertNotEqual(
+            self.reader_client.get(self.post_url)['ETag'], etag
+        )
+        self.assertEqual(
+            self.revalidate(self.reader_client, self.post_url, etag)[0],
+            HTTPStatus.OK
+        )
+
+    def test_post_page_changes_with_comments_and_author(self):
+        for change in (
+            lambda: Comment.objects.create(
+                post=self.post, author=self.reader, text='Комментарий'
+            ),
+            lambda: User.objects.filter(pk=self.author.pk).first().save(),
+        ):
+            etag = self.client.get(self.post_url)['ETag']
+            change()
+            self.assertEqual(
+                self.revalidate(self.client, self.post_url, etag)[0],
+                HTTPStatus.OK
+            )
+
+    def test_profile_changes_with_posts_and_follows(self):
+        for change in (
+            lambda: Post.objects.create(text='Ещё пост', author=self.author),
+            lambda: Follow.objects.create(
+                user=self.reader, author=self.author
+            ),
+        ):
+            etag = self.reader_client.get(self.profile_url)['ETag']
+            change()
+            self.assertEqual(
+                self.revalidate(self.reader_client, self.profile_url, etag)[0],
+                HTTPStatus.OK
+            )
@@ -0,0 +1,341 @@
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Sum
+
+from posts.models import FeedEntry, Follow, Post, UserCounter
+from posts.paginators import (
+    MergedKeysetPaginator, count_cache_key, keyset_keys, merge_keys
+)
+
+
+PULLED_AUTHORS_KEY: str = 'posts:pulled_authors'
+RECENT_KEYS_KEY: str = 'posts:author_recent:{}'
+# авторов в одном запросе latest_keys (SQLite: до 500 частей UNION)
+RECENT_QUERY_AUTHORS: int = 100
+
+
+def pulled_authors():
+    """Авторы, чьи посты не раскладываются по лентам, а читаются слиянием."""
+    authors = cache.get(PULLED_AUTHORS_KEY)
+    if authors is None:
+        authors = frozenset(
+            UserCounter.objects.filter(
+                followers_count__gte=settings.POSTS_FEED_PULL_THRESHOLD
+            ).values_list('user_id', flat=True)
+        )
+        cache.set(
+            PULLED_AUTHORS_KEY,
+            authors,
+            settings.POSTS_FEED_PULL_CACHE_TIMEOUT
+        )
+    return authors
+
+
+def is_pulled(author_id):
+    threshold = settings.POSTS_FEED_PULL_THRESHOLD
+    if threshold is None:
+        return False
+    return threshold == 0 or author_id in pulled_authors()
+
+
+def _bulk_insert(entries):
+    # Django 2.2 не ограничивает batch_size возможностями базы (у SQLite —
+    # 500 строк в одном INSERT), поэтому берём меньшее из двух.
+    batch_size = min(
+        settings.POSTS_FEED_BATCH_SIZE,
+        connection.ops.bulk_batch_size(
+            FeedEntry._meta.concrete_fields, entries
+        ) or settings.POSTS_FEED_BATCH_SIZE
+    )
+    FeedEntry.objects.bulk_create(
+        entries, batch_size=batch_size, ignore_conflicts=True
+    )
+
+
+def fan_out(post):
+    """Раскладывает новый пост в ленты подписчиков автора пачками.
+
+    Возвращает id подписчиков, в чьи ленты пост записан; посты авторов,
+    читаемых слиянием, не пишутся и не меняют кэш подсчёта лент
+    (см. FollowFeed.count).
+    """
+    if is_pulled(post.author_id):
+        return []
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True).order_by('user_id')
+    user_ids = []
+    batch = []
+    for user_id in followers.iterator(
+        chunk_size=settings.POSTS_FEED_BATCH_SIZE
+    ):
+        user_ids.append(user_id)
+        batch.append(FeedEntry(
+            user_id=user_id,
+            post_id=post.pk,
+            author_id=post.author_id,
+            pub_date=post.pub_date,
+        ))
+        if len(batch) >= settings.POSTS_FEED_BATCH_SIZE:
+            _bulk_insert(batch)
+            batch = []
+    if batch:
+        _bulk_insert(batch)
+    return user_ids
+
+
+def fan_out_many(posts):
+    """Раскладывает пачку постов в ленты подписчиков их авторов;
+    возвращает id подписчиков, чьи ленты изменились."""
+    author_ids = {
+        post.author_id for post in posts if not is_pulled(post.author_id)
+    }
+    followers = {}
+    for author_id, user_id in Follow.objects.filter(
+        author_id__in=author_ids
+    ).values_list('author_id', 'user_id'):
+        followers.setdefault(author_id, []).append(user_id)
+    entries = [
+        FeedEntry(
+            user_id=user_id,
+            post_id=post.pk,
+            author_id=post.author_id,
+            pub_date=post.pub_date,
+        )
+        for post in posts
+        for user_id in followers.get(post.author_id, ())
+    ]
+    _bulk_insert(entries)
+    return {entry.user_id for entry in entries}
+
+
+def backfill(follow):
+    """Добавляет в ленту подписчика последние посты нового автора."""
+    posts = Post.objects.filter(
+        author_id=follow.author_id
+    ).order_by('-pub_date').values_list('pk', 'pub_date')
+    _bulk_insert([
+        FeedEntry(
+            user_id=follow.user_id,
+            post_id=post_id,
+            author_id=follow.author_id,
+            pub_date=pub_date,
+        )
+        for post_id, pub_date in posts[:settings.POSTS_FEED_BACKFILL]
+    ])
+
+
+def backfill_followers(author_id):
+    """Раскладывает последние посты автора в ленты всех его подписчиков."""
+    posts = list(Post.objects.filter(
+        author_id=author_id
+    ).order_by('-pub_date').values_list(
+        'pk', 'pub_date'
+    )[:settings.POSTS_FEED_BACKFILL])
+    followers = Follow.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True).order_by('user_id')
+    batch = []
+    for user_id in followers.iterator(
+        chunk_size=settings.POSTS_FEED_BATCH_SIZE
+    ):
+        batch.extend(
+            FeedEntry(
+                user_id=user_id,
+                post_id=post_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+            for post_id, pub_date in posts
+        )
+        if len(batch) >= settings.POSTS_FEED_BATCH_SIZE:
+            _bulk_insert(batch)
+            batch = []
+    if batch:
+        _bulk_insert(batch)
+
+
+def follower_lost(author_id):
+    """Проверяет, не опустился ли автор ниже POSTS_FEED_PULL_THRESHOLD.
+
+    Пока автор читался слиянием, его посты не попадали в FeedEntry;
+    выходя из этого режима, он получает их в лентах подписчиков
+    (последние POSTS_FEED_BACKFILL, как при новой подписке), а кэш
+    списка таких авторов сбрасывается, чтобы новые посты снова
+    раскладывались. Возвращает True, если автор вышел из режима.
+    """
+    threshold = settings.POSTS_FEED_PULL_THRESHOLD
+    if not threshold or author_id not in pulled_authors():
+        return False
+    if UserCounter.objects.filter(
+        user_id=author_id, followers_count__gte=threshold
+    ).exists():
+        return False
+    cache.delete(PULLED_AUTHORS_KEY)
+    backfill_followers(author_id)
+    return True
+
+
+def trim(follow):
+    """Убирает из ленты подписчика посты автора, от которого он отписался."""
+    FeedEntry.objects.filter(
+        user_id=follow.user_id,
+        author_id=follow.author_id
+    ).delete()
+
+
+def user_timeline(user):
+    return FeedEntry.objects.filter(user=user).select_related(
+        'post__author', 'post__group'
+    )
+
+
+def invalidate_recent_keys(author_id):
+    cache.delete(RECENT_KEYS_KEY.format(author_id))
+
+
+def latest_keys(author_ids, limit):
+    """Последние limit ключей (дата, id) каждого автора одним запросом:
+    UNION ALL подзапросов с LIMIT, каждый идёт по индексу автора."""
+    author_ids = list(author_ids)
+    result = {author_id: [] for author_id in author_ids}
+    table = Post._meta.db_table
+    for start in range(0, len(author_ids), RECENT_QUERY_AUTHORS):
+        chunk = author_ids[start:start + RECENT_QUERY_AUTHORS]
+        sql = ' UNION ALL '.join(
+            f'SELECT * FROM (SELECT id, author_id, pub_date FROM {table} '
+            f'WHERE author_id = %s ORDER BY pub_date DESC, id DESC '
+            f'LIMIT %s) AS recent{number}'
+            for number in range(len(chunk))
+        )
+        params = [value for author_id in chunk for value in (author_id, limit)]
+        for post in Post.objects.raw(sql, params):
+            result[post.author_id].append((post.pub_date, post.pk))
+    for keys in result.values():
+        keys.sort(reverse=True)
+    return result
+
+
+def recent_keys(author_ids):
+    """Кэшированные списки ключей (дата, id) последних постов авторов;
+    недостающие читаются одним запросом (latest_keys)."""
+    cache_keys = {
+        author_id: RECENT_KEYS_KEY.format(author_id)
+        for author_id in author_ids
+    }
+    cached = cache.get_many(cache_keys.values())
+    missing = latest_keys(
+        [
+            author_id for author_id, cache_key in cache_keys.items()
+            if cache_key not in cached
+        ],
+        settings.POSTS_FEED_AUTHOR_RECENT
+    )
+    cache.set_many(
+        {cache_keys[author_id]: keys for author_id, keys in missing.items()},
+        settings.POSTS_FEED_PULL_CACHE_TIMEOUT
+    )
+    return {
+        author_id: missing.get(author_id, cached.get(cache_key))
+        for author_id, cache_key in cache_keys.items()
+    }
+
+
+def author_keys(author_id, recent, limit, after=None, before=None):
+    """Поток ключей автора: из кэша, а если его не хватает — из базы."""
+    complete = len(recent) < settings.POSTS_FEED_AUTHOR_RECENT
+    if before is not None:
+        keys = [key for key in reversed(recent) if key > before]
+        if complete or recent[-1] <= before:
+            return keys[:limit]
+    elif after is not None:
+        keys = [key for key in recent if key < after]
+        if complete or len(keys) >= limit:
+            return keys[:limit]
+    elif complete or len(recent) >= limit:
+        return recent[:limit]
+    return keyset_keys(
+        Post.objects.filter(author_id=author_id), limit, after, before
+    )
+
+
+def posts_for_keys(keys):
+    ids = [pk for _, pk in keys]
+    posts = Post.objects.select_related('author', 'group').in_bulk(ids)
+    return [posts[pk] for pk in ids if pk in posts]
+
+
+class FollowFeed:
+    """Лента подписок пользователя.
+
+    Посты обычных авторов читаются из материализованной ленты FeedEntry,
+    посты авторов с числом подписчиков от POSTS_FEED_PULL_THRESHOLD
+    подтягиваются при чтении k-way слиянием их кэшированных списков.
+    Поддерживает срезы и count() для Paginator и курсорную пагинацию.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.pulled = []
+        if settings.POSTS_FEED_PULL_THRESHOLD is not None:
+            self.pulled = [
+                author_id for author_id in Follow.objects.filter(
+                    user=user
+                ).values_list('author_id', flat=True)
+                if is_pulled(author_id)
+            ]
+
+    def _timeline(self):
+        entries = FeedEntry.objects.filter(user=self.user)
+        if self.pulled:
+            entries = entries.exclude(author_id__in=self.pulled)
+        return entries
+
+    def count(self):
+        """Число постов ленты.
+
+        В кэше (область follow:<id>) лежит только часть из FeedEntry
+        вместе с набором авторов, читаемых слиянием; посты этих авторов
+        берутся из их счётчиков, поэтому их новые и удалённые посты
+        не сбрасывают кэш у всех подписчиков.
+        """
+        key = count_cache_key(f'follow:{self.user.pk}')
+        pulled = sorted(self.pulled)
+        cached = cache.get(key)
+        if cached is not None and cached[0] == pulled:
+            count = cached[1]
+        else:
+            count = self._timeline().count()
+            cache.set(
+                key, (pulled, count), settings.POSTS_COUNT_CACHE_TIMEOUT
+            )
+        if self.pulled:
+            count += UserCounter.objects.filter(
+                user_id__in=self.pulled
+            ).aggregate(total=Sum('posts_count'))['total'] or 0
+        return count
+
+    def streams(self, limit, after=None, before=None):
+        streams = [keyset_keys(
+            self._timeline(), limit, after, before, id_field='post_id'
+        )]
+        recent = recent_keys(self.pulled)
+        streams.extend(
+            author_keys(author_id, recent[author_id], limit, after, before)
+            for author_id in self.pulled
+        )
+        return streams
+
+    def __getitem__(self, index):
+        if not self.pulled:
+            return [
+                entry.post for entry in user_timeline(self.user)[index]
+            ]
+        keys = merge_keys(self.streams(index.stop))
+        return posts_for_keys(list(islice(keys, index.start, index.stop)))
+
+    def keyset_paginator(self, per_page):
+        return MergedKeysetPaginator(self.streams, posts_for_keys, per_page)
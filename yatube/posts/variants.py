@@ -0,0 +1,137 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+
+from core.caching import bump
+from core.thumbnails import background
+from posts.models import ImageVariant, Post
+from posts.scopes import image_page_scopes
+
+
+FORMATS = {
+    'avif': ('AVIF', 'avif'),
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+}
+
+
+def supported_formats():
+    """Форматы из POSTS_IMAGE_VARIANT_FORMATS, которые умеет сохранять
+    установленный Pillow (AVIF и WebP есть не в каждой сборке)."""
+    Image.init()
+    return [
+        name for name in settings.POSTS_IMAGE_VARIANT_FORMATS
+        if FORMATS[name][0] in Image.SAVE
+        and (name != 'webp' or features.check('webp'))
+    ]
+
+
+def variant_sizes(width):
+    """Ширины и высоты вариантов для картинки шириной width.
+
+    Варианты шире исходной картинки не делаются, кроме самого узкого.
+    """
+    ratio_width, ratio_height = settings.POSTS_IMAGE_VARIANT_ASPECT
+    widths = [
+        variant for variant in settings.POSTS_IMAGE_VARIANT_WIDTHS
+        if variant <= width
+    ] or [min(settings.POSTS_IMAGE_VARIANT_WIDTHS)]
+    return [
+        (variant, round(variant * ratio_height / ratio_width))
+        for variant in widths
+    ]
+
+
+def encode(image, image_format):
+    pil_format, _ = FORMATS[image_format]
+    if pil_format == 'JPEG':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    output = BytesIO()
+    image.save(
+        output,
+        pil_format,
+        quality=settings.POSTS_IMAGE_VARIANT_QUALITY,
+        optimize=pil_format == 'JPEG'
+    )
+    return output.getvalue()
+
+
+def delete_variants(name):
+    """Удаляет варианты картинки name вместе с файлами, возвращает их число.
+
+    Вызывается, когда на файл не остаётся ссылок (posts.blobs.collect).
+    """
+    variants = list(ImageVariant.objects.filter(source=name))
+    for variant in variants:
+        variant.image.delete(save=False)
+    ImageVariant.objects.filter(pk__in=[v.pk for v in variants]).delete()
+    return len(variants)
+
+
+def build_variants(name, force=False):
+    """Создаёт варианты картинки name, возвращает их число.
+
+    Варианты общие для всех постов с этим файлом и создаются один раз;
+    force пересоздаёт их. bulk_create не шлёт сигналов, поэтому кэш
+    страниц с картинкой сбрасывается здесь же: в srcset должны попасть
+    новые варианты.
+    """
+    if not name or not Post.objects.filter(image=name).exists():
+        return 0
+    if force:
+        delete_variants(name)
+    elif ImageVariant.objects.filter(source=name).exists():
+        return 0
+    field = Post._meta.get_field('image')
+    with field.storage.open(name, 'rb') as source:
+        image = Image.open(source)
+        image.load()
+    base = os.path.splitext(os.path.basename(name))[0]
+    variants = []
+    for width, height in variant_sizes(image.width):
+        resized = ImageOps.fit(image, (width, height), Image.LANCZOS)
+        for image_format in supported_formats():
+            variant = ImageVariant(
+                source=name, format=image_format, width=width, height=height
+            )
+            extension = FORMATS[image_format][1]
+            variant.image.save(
+                f'{base}_{width}.{extension}',
+                ContentFile(encode(resized, image_format)),
+                save=False
+            )
+            variants.append(variant)
+    ImageVariant.objects.bulk_create(variants)
+    bump(*image_page_scopes(name))
+    return len(variants)
+
+
+def prefetch(posts):
+    """Варианты картинок постов одним запросом: post.variants."""
+    posts = [post for post in posts if post.image]
+    by_source = {}
+    if posts:
+        for variant in ImageVariant.objects.filter(
+            source__in={post.image.name for post in posts}
+        ):
+            by_source.setdefault(variant.source, []).append(variant)
+    for post in posts:
+        post.variants = by_source.get(post.image.name, [])
+
+
+def variants_of(post):
+    """Варианты картинки поста: собранные prefetch() или из базы."""
+    variants = getattr(post, 'variants', None)
+    if variants is None:
+        variants = ImageVariant.objects.filter(source=post.image.name)
+    return variants
+
+
+def schedule(name):
+    """Создаёт варианты картинки в пуле потоков."""
+    background(f'variants:{name}', build_variants, name)
@@ -1,37 +1,80 @@
 
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils.http import urlencode
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
 
 
-from posts.paginators import paginator
+from core import thumbnails
+from core.caching import conditional_page, shell_cache_page
+from core.querybudget import query_budget
+from posts import variants
+from posts.exporting import (
+    CONTENT_TYPES, TABLES, export_chunks, gzip_chunks
+)
+from posts.feeds import conditional_feed, feed_response
+from posts.paginators import (
+    CachedCountPaginator, KeysetPaginator, paginator
+)
 from posts.forms import PostForm, CommentForm
 from posts.models import Post, Group, Follow, User
+from posts.scopes import post_scopes
+from posts.search import SearchResults
+from posts.timeline import FollowFeed
 
 
 COUNT_POSTS: int = 10
 COUNT_SYMBHOLS: int = 30
+COUNT_COMMENTS: int = 20
 
 
-@cache_page(20, key_prefix='index_page')
+def prefetch_images(page_obj):
+    """Записи о миниатюрах и варианты картинок всей страницы: по запросу
+    на страницу, а не на каждую картинку в шаблоне."""
+    thumbnails.prefetch(
+        [post.image.name for post in page_obj if post.image],
+        settings.POSTS_THUMBNAIL_GEOMETRIES
+    )
+    variants.prefetch(page_obj)
+
+
+@query_budget(6)
+@shell_cache_page(
+    settings.POSTS_PAGE_CACHE_TIMEOUT,
+    'index_page',
+    lambda: ['posts']
+)
 def index(request):
     page_obj = paginator(
         request,
-        Post.objects.select_related('author').all(),
-        COUNT_POSTS
+        Post.objects.select_related('author', 'group'),
+        COUNT_POSTS,
+        scope='all'
     )
+    prefetch_images(page_obj)
     context = {
         'page_obj': page_obj,
     }
     return render(request, 'posts/index.html', context)
 
 
+@query_budget(7)
+@shell_cache_page(
+    settings.POSTS_PAGE_CACHE_TIMEOUT,
+    'group_page',
+    lambda slug: [f'group:{slug}']
+)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
     page_obj = paginator(
         request,
-        group.posts.all().select_related('group', 'author'),
-        COUNT_POSTS)
+        group.posts.select_related('group', 'author'),
+        COUNT_POSTS,
+        scope=f'group:{group.pk}')
+    prefetch_images(page_obj)
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -39,26 +82,47 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@query_budget(8)
+@conditional_page(lambda username: [f'author:{username}'])
+@shell_cache_page(
+    settings.POSTS_PAGE_CACHE_TIMEOUT,
+    'profile_page',
+    lambda username: [f'author:{username}']
+)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts_user = author.posts.all()
-    page_obj = paginator(request, posts_user, COUNT_POSTS)
-    following = (
-        request.user.is_authenticated and author.following.filter(
-            user=request.user
-        ).exists()
+    author = get_object_or_404(
+        User.objects.select_related('counters'),
+        username=username
     )
+    posts_user = author.posts.select_related('group')
+    page_obj = paginator(
+        request, posts_user, COUNT_POSTS, scope=f'author:{author.pk}'
+    )
+    prefetch_images(page_obj)
     context = {
         'page_obj': page_obj,
         'author': author,
-        'following': following,
     }
     return render(request, 'posts/profile.html', context)
 
 
+@query_budget(6)
+@conditional_page(post_scopes)
+@shell_cache_page(
+    settings.POSTS_PAGE_CACHE_TIMEOUT,
+    'post_page',
+    post_scopes
+)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    comments = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.select_related('author__counters', 'group'),
+        id=post_id
+    )
+    comments = KeysetPaginator(
+        post.comments.select_related('author'),
+        COUNT_COMMENTS,
+        date_field='created'
+    ).get_page()
     form = CommentForm()
     context = {
         'comments': comments,
@@ -68,6 +132,105 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+@query_budget(3)
+def post_comments(request, post_id):
+    post = get_object_or_404(Post.objects.only('pk'), id=post_id)
+    comments = KeysetPaginator(
+        post.comments.select_related('author'),
+        COUNT_COMMENTS,
+        date_field='created'
+    ).get_page(after=request.GET.get('after'))
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'comments': [
+                {
+                    'id': comment.pk,
+                    'author': comment.author.username,
+                    'text': comment.text,
+                    'created': comment.created.isoformat(),
+                }
+                for comment in comments
+            ],
+            'next': comments.next_cursor,
+        })
+    context = {
+        'comments': comments,
+        'post': post,
+    }
+    return render(request, 'includes/comments.html', context)
+
+
+@query_budget(1)
+@conditional_feed(lambda **kwargs: ['posts'])
+def index_feed(request, feed_format, updated):
+    return feed_response(
+        request, feed_format, Post.objects.all(),
+        'Yatube: последние записи', reverse('posts:index'), updated
+    )
+
+
+@query_budget(2)
+@conditional_feed(lambda slug, **kwargs: [f'group:{slug}'])
+def group_feed(request, feed_format, slug, updated):
+    group = get_object_or_404(Group.objects.only('pk', 'title'), slug=slug)
+    return feed_response(
+        request, feed_format, group.posts.all(), f'Yatube: {group.title}',
+        reverse('posts:group_list', args=(slug,)), updated
+    )
+
+
+@query_budget(2)
+@conditional_feed(lambda username, **kwargs: [f'author:{username}'])
+def profile_feed(request, feed_format, username, updated):
+    author = get_object_or_404(
+        User.objects.only('pk', 'username', 'first_name', 'last_name'),
+        username=username
+    )
+    return feed_response(
+        request, feed_format, author.posts.all(),
+        f'Yatube: {author.get_full_name() or author.username}',
+        reverse('posts:profile', args=(username,)), updated
+    )
+
+
+@query_budget(2)
+@staff_member_required
+def export(request, table):
+    """Потоковая выгрузка таблицы для аналитики: ?format=ndjson|csv,
+    ?gzip=1 сжимает файл на лету."""
+    record_format = request.GET.get('format', 'ndjson')
+    if table not in TABLES or record_format not in CONTENT_TYPES:
+        raise Http404
+    chunks = export_chunks(
+        table, record_format, settings.POSTS_EXPORT_BATCH_SIZE
+    )
+    filename = f'{table}.{record_format}'
+    content_type = CONTENT_TYPES[record_format]
+    if request.GET.get('gzip'):
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        content_type = 'application/gzip'
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@query_budget(7)
+def search(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = CachedCountPaginator(
+        SearchResults(query), COUNT_POSTS
+    ).get_page(request.GET.get('page'))
+    prefetch_images(page_obj)
+    context = {
+        'page_obj': page_obj,
+        'query': query,
+        'page_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@query_budget(18)
 @login_required
 def post_create(request):
     form = PostForm(
@@ -81,11 +244,12 @@ def post_create(request):
     return render(request, 'posts/create_post.html', {'form': form})
 
 
+@query_budget(21)
 @login_required
 def post_edit(request, post_id):
     is_edit = True
     post = get_object_or_404(Post, id=post_id)
-    if request.user != post.author:
+    if request.user.pk != post.author_id:
         return redirect('posts:post_detail', post_id=post.pk)
     form = PostForm(
         request.POST or None,
@@ -102,6 +266,7 @@ def post_edit(request, post_id):
     return render(request, 'posts/create_post.html', context)
 
 
+@query_budget(5)
 @login_required
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
@@ -114,21 +279,23 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+# Сессия и пользователь, авторы подписок и список читаемых слиянием,
+# число постов из FeedEntry и счётчиков, ключи страницы из FeedEntry
+# и последних постов этих авторов, сами посты, миниатюры и варианты.
+@query_budget(11)
 @login_required
 def follow_index(request):
-    page_obj = paginator(
-        request,
-        Post.objects.filter(
-            author__following__user=request.user
-        ),
-        COUNT_POSTS
-    )
+    page_obj = paginator(request, FollowFeed(request.user), COUNT_POSTS)
+    prefetch_images(page_obj)
     context = {
         'page_obj': page_obj,
     }
     return render(request, 'posts/follow.html', context)
 
 
+# Сессия, пользователь и автор; get_or_create (SELECT, INSERT и две
+# точки сохранения), два счётчика и перенос постов автора в ленту.
+@query_budget(13)
 @login_required
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
@@ -137,13 +304,20 @@ def profile_follow(request, username):
     return redirect('posts:profile', author)
 
 
+# Сессия, пользователь, автор и подписка; её удаление, два счётчика,
+# очистка ленты и список читаемых слиянием. Выход автора из этого
+# режима (timeline.follower_lost) раскладывает его посты всем
+# подписчикам и в бюджет не входит: это редкий переход.
+@query_budget(9)
 @login_required
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     following = Follow.objects.filter(
         user=request.user,
         author=author
-    )
-    if following.exists():
+    ).first()
+    if following is not None:
+        # Сигналы берут имена из связанных объектов: без лишних запросов.
+        following.user, following.author = request.user, author
         following.delete()
     return redirect('posts:profile', username)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -42,6 +43,7 @@ INSTALLED_APPS = [
     'posts.apps.PostsConfig',
     'users.apps.UsersConfig',
     'core.apps.CoreConfig',
+    'api.apps.ApiConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -51,6 +53,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.querybudget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -151,9 +154,147 @@ EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 # using cache
+# versions of cache scopes (core.caching) live here too: with several
+# worker processes the backend must be shared (Memcached, Redis),
+# otherwise each process keeps its own versions and serves stale pages
 
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
+
+# cursor pagination of post feeds (?after= / ?before=)
+
+POSTS_CURSOR_PAGINATION = False
+
+# lifetime of cached post counts used by the paginator
+
+POSTS_COUNT_CACHE_TIMEOUT = 60 * 60
+
+# materialized follow feed: fan-out batch size and number of an author's
+# latest posts copied into the feed on follow
+
+POSTS_FEED_BATCH_SIZE = 1000
+
+POSTS_FEED_BACKFILL = 100
+
+# hybrid follow feed: authors with at least this many followers are not
+# fanned out but merged into feeds at read time (0 - pull everyone,
+# None - push everyone); length of the cached per-author post lists
+
+POSTS_FEED_PULL_THRESHOLD = 10000
+
+POSTS_FEED_AUTHOR_RECENT = 200
+
+POSTS_FEED_PULL_CACHE_TIMEOUT = 60 * 10
+
+# lifetime of post pages cached under versioned keys; pages are
+# invalidated by posts.signals as soon as their content changes
+
+POSTS_PAGE_CACHE_TIMEOUT = 60 * 60 * 6
+
+# per-view query budgets and N+1 detection (core.querybudget): repeated
+# SQL of one shape at least QUERY_BUDGET_N_PLUS_ONE times is reported
+
+QUERY_BUDGET_ENABLED = DEBUG
+
+QUERY_BUDGET_N_PLUS_ONE = 5
+
+QUERY_BUDGET_RAISE = False
+
+# thumbnails and image variants are generated in a background thread pool
+# right after a post image is saved and pages show the original image until
+# then; precompute_thumbnails fills in the rest (0 workers - generate
+# synchronously, used in development so runserver and tests stay
+# deterministic)
+
+THUMBNAIL_BACKEND = 'core.thumbnails.BackgroundThumbnailBackend'
+
+THUMBNAIL_WORKERS = 0 if DEBUG else 2
+
+THUMBNAIL_QUEUE = 100
+
+POSTS_THUMBNAIL_GEOMETRIES = [
+    ('960x339', {'crop': 'center', 'upscale': True}),
+]
+
+# responsive post image variants (posts.variants): widths, formats in order
+# of preference (those the installed Pillow cannot write are skipped),
+# crop aspect ratio and encoder quality
+
+POSTS_IMAGE_VARIANT_WIDTHS = (320, 640, 960)
+
+POSTS_IMAGE_VARIANT_FORMATS = ('avif', 'webp', 'jpeg')
+
+POSTS_IMAGE_VARIANT_ASPECT = (960, 339)
+
+POSTS_IMAGE_VARIANT_QUALITY = 80
+
+# in-process LRU tier in front of the sorl-thumbnail cached_db key-value
+# store: number of entries and how long another process's writes may go
+# unnoticed
+
+THUMBNAIL_KVSTORE = 'core.thumbnails.LRUKVStore'
+
+THUMBNAIL_LRU_SIZE = 10000
+
+THUMBNAIL_LRU_TIMEOUT = 60 * 10
+
+# single-flight thumbnail generation: how long other requests wait for the
+# thumbnail being rendered before serving the original image, where worker
+# processes of one host keep their lock files (flock, released by the kernel
+# if a worker crashes) and when the cache lock used where flock is missing
+# expires
+
+THUMBNAIL_LOCK_WAIT = 5
+
+THUMBNAIL_LOCK_DIR = os.path.join(tempfile.gettempdir(), 'yatube-locks')
+
+THUMBNAIL_LOCK_TIMEOUT = 60
+
+# on-the-fly image resizing (core.resize): largest side allowed in a signed
+# URL, size cap of the disk cache in MEDIA_ROOT/r/ (least recently
+# requested copies are evicted first), encoder quality and browser cache
+# lifetime
+
+RESIZE_MAX_SIZE = 2000
+
+RESIZE_CACHE_MAX_SIZE = 512 * 1024 * 1024
+
+RESIZE_QUALITY = 85
+
+RESIZE_MAX_AGE = 60 * 60 * 24 * 30
+
+# uploads are streamed to a temporary file while being hashed; images over
+# these limits are rejected before Pillow decodes them, accepted ones are
+# stored once per content hash (posts.blobs)
+
+FILE_UPLOAD_HANDLERS = ['core.uploads.HashingUploadHandler']
+
+UPLOAD_IMAGE_MAX_SIZE = 20 * 1024 * 1024
+
+UPLOAD_IMAGE_MAX_SIDE = 10000
+
+UPLOAD_IMAGE_MAX_PIXELS = 50 * 1000 * 1000
+
+# new uploads are rotated by EXIF, stripped of metadata, downscaled to this
+# side and re-encoded (posts.images)
+
+UPLOAD_IMAGE_NORMALIZE_MAX_SIDE = 2560
+
+UPLOAD_IMAGE_QUALITY = 85
+
+# public read-only JSON API (api app): default and maximum page size
+
+API_PAGE_SIZE = 20
+
+API_MAX_PAGE_SIZE = 100
+
+# RSS/Atom feeds of the index, groups and authors: number of latest posts
+
+POSTS_FEED_ITEMS = 50
+
+# streaming exports (export_yatube, posts:export): rows per database query
+
+POSTS_EXPORT_BATCH_SIZE = 2000
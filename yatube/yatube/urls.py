@@ -19,6 +19,8 @@ from django.urls import include, path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from core.views import resize_image
+
 
 handler404 = 'core.views.page_not_found'
 handler500 = 'core.views.server_error'
@@ -31,6 +33,13 @@ urlpatterns = [
     path('auth/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls', namespace='about')),
+    path('api/v1/', include('api.urls', namespace='api')),
+    path(
+        settings.MEDIA_URL.lstrip('/')
+        + 'r/<str:signature>/<int:width>x<int:height>/<path:path>',
+        resize_image,
+        name='resize_image'
+    ),
 ]
 
 